@@ -1,23 +1,31 @@
 #!/usr/bin/python
 """
 Add archivist_note and date columns to metadata, and merge with csv list
-of bad arcs 
+of bad arcs. With -s the metadata comes from a metadataStore instead, and
+the list is joined against it there.
 """
 
 from getopt import getopt, GetoptError
-from csv import DictWriter, DictReader, reader
+from csv import reader
 import sys, re, requests, time, random
 from datetime import datetime
 from time import strftime
 from hurry.filesize import size
 from os import stat
 from shutil import move
+from opensslStream import openMetadata
+from metadataStore import MetadataStore
+from metadataRow import metadataReader, metadataWriter, NOTE_FIELDS, FILENAME, FOLDER, \
+     DATE_ARCHIVIST_NOTE, ARCHIVIST_NOTE
 
 
 IDENTIFIER_BASE = 'file:///T:WORK/RW_32/content/'
 
 def main(argv):
-    mountpoint, ifname, ofname = getParms()
+    mountpoint, ifname, ofname, storename = getParms()
+    if storename:
+        joinStore(storename, ifname, ofname)
+        return
     if not mountpoint.endswith('/'):
         mountpoint = mountpoint  + '/'
     metaname = mountpoint + 'RW_32/metadata_v7.csv'
@@ -25,51 +33,74 @@ def main(argv):
     try:
         #scl enable python27 bash
         # to allow multiple openings on one line
-        with open(metaname, "rb") as mi, open(ifname, "rb") as cl, open(ofname, "wb") as mo:
-            fields = ['identifier','filename','folder','date_created','checksum', \
-                      'series_number','creating_body','crawl_start', 'crawl_end', \
-                      'filesize', 'unit']
-            all_fields = fields + ['date_archivist_note', 'archivist_note']
-            metareader = DictReader(mi, fieldnames=fields)
-            creader = reader(cl)
-            # will always be tiny wrt metadata so slurp
-            corrupt = {}
-            for row in creader:
-                corrupt[row[0]] = [row[1], row[2]]
-            writer = DictWriter(mo, delimiter=',', fieldnames=all_fields)
-            writer.writerow(dict((fn,fn) for fn in all_fields))
+        with openMetadata(metaname, "rb") as mi, openMetadata(ifname, "rb") as cl, \
+             openMetadata(ofname, "wb") as mo:
+            metareader = metadataReader(mi)
+            corrupt = readCorruptList(cl)
+            writer = metadataWriter(mo, NOTE_FIELDS)
             print "[INFO] Opened files successfully."
             modifyMetadata(metareader, corrupt, writer)
     except IOError as e:
         print "[IOERROR] " + e
 
+def joinStore(storename, ifname, ofname):
+    """
+    Write the metadata in a store out with the notes from the corrupt list,
+    joined by filename in the store.
+    """
+    store = MetadataStore(storename)
+    try:
+        with openMetadata(ifname, "rb") as cl, openMetadata(ofname, "wb") as mo:
+            corrupt = readCorruptList(cl)
+            writer = metadataWriter(mo, NOTE_FIELDS)
+            print "[INFO] Opened files successfully."
+            for row in store.rowsWithNotes(corrupt):
+                writer.writerow(row)
+    except IOError as e:
+        print "[IOERROR] %s" % e
+    finally:
+        store.close()
+
+def readCorruptList(cl):
+    """
+    Read the list of bad arcs into a dict of filename -> [date, note].
+    """
+    creader = reader(cl)
+    # will always be tiny wrt metadata so slurp
+    corrupt = {}
+    for row in creader:
+        corrupt[row[0]] = [row[1], row[2]]
+    return corrupt
+
 def modifyMetadata(metareader, corrupt, writer):
+    for row in addNotes(corrupt, metareader):
+        writer.writerow(row)
 
+def addNotes(corrupt, rows):
+    """
+    Add the archivist note date and text to each row, from the corrupt
+    list for bad files and empty otherwise. Rows that already have notes
+    (duplicates flagged by dedupeArcs) keep them, with a corrupt file's
+    note added after.
+    """
     # default start_date
     start_date = ''
-    # skip header row
-    next(metareader, None)
-    for row in metareader:
-        if row['folder'] == 'folder':
-            row['date_archivist_note'] = ''
-            row['archivist_note'] = ''
-        else:
-            filename = row['filename']
-            if filename in corrupt:
-                row['date_archivist_note'] = corrupt[filename][0]
-                row['archivist_note'] = corrupt[filename][1]
-            else:
-                row['date_archivist_note'] = ''
-                row['archivist_note'] = ''
-        writer.writerow(row)
+    for row in rows:
+        # notes for folders and for files that are not corrupt
+        row += [''] * (len(NOTE_FIELDS) - len(row))
+        if row[FOLDER] != 'folder' and row[FILENAME] in corrupt:
+            date, note = corrupt[row[FILENAME]]
+            row[DATE_ARCHIVIST_NOTE] = date
+            row[ARCHIVIST_NOTE] = '; '.join(text for text in (row[ARCHIVIST_NOTE], note) if text)
+        yield row
             
 def getParms():
     """
     Get command line parameters.
     """
-    mountpoint = ifile = ofile = ""
+    mountpoint = ifile = ofile = store = ""
     try:
-        myopts, args = getopt(sys.argv[1:],"m:i:o:")
+        myopts, args = getopt(sys.argv[1:],"m:i:o:s:")
     except GetoptError as e:
         print (str(e))
         usage()
@@ -81,14 +112,16 @@ def getParms():
             ifile = a
         elif o == '-o':
             ofile = a
+        elif o == '-s':
+            store = a
 
-    if not (mountpoint and ifile and ofile):
+    if not ((mountpoint or store) and ifile and ofile):
         usage()
 
-    return (mountpoint, ifile, ofile)
+    return (mountpoint, ifile, ofile, store)
 
 def usage():
-    print("Usage: %s -m mountpoint -i corrupt_list -o outputmetadata" % sys.argv[0])
+    print("Usage: %s (-m mountpoint | -s metadatastore) -i corrupt_list -o outputmetadata" % sys.argv[0])
     sys.exit(2)
 
 
@@ -0,0 +1,72 @@
+"""
+Checksum Arc files in a pool of processes, computing several digests
+from a single read of each file with large read buffers.
+"""
+
+import hashlib, os
+from multiprocessing import Pool, cpu_count
+import metrics
+
+DIGESTS = ('md5', 'sha256')
+BLOCK_SIZE = 16 * 1024 * 1024   # 16 MB reads, rather than 4096 bytes
+# AsyncResult.get() without a timeout cannot be interrupted under python 2
+MAX_WAIT = 7 * 24 * 3600
+
+def hashFile(fname, digests=DIGESTS):
+    """
+    Read a file once, feeding every block to each digest. Returns a dict of
+    digest name -> hex digest.
+    """
+    hashes = [hashlib.new(name) for name in digests]
+    with open(fname, "rb") as f:
+        for chunk in iter(lambda: f.read(BLOCK_SIZE), b""):
+            for h in hashes:
+                h.update(chunk)
+    return dict((name, h.hexdigest()) for name, h in zip(digests, hashes))
+
+class ArcHasher(object):
+    """
+    Hash files in a process pool. Files are queued in the order they will
+    be needed and their results collected in that order, so the output is
+    unchanged while every core is kept busy. Files already in the
+    ChecksumCache, if one is given, are not read at all.
+    """
+
+    def __init__(self, processes=None, cache=None):
+        self.pool = Pool(processes or cpu_count())
+        self.cache = cache
+        self.results = {}
+
+    def submit(self, fnames):
+        """
+        Queue files for hashing, in the order they will be asked for.
+        """
+        for fname in fnames:
+            if fname in self.results:
+                continue
+            cached = self.cache.get(fname) if self.cache else None
+            if cached:
+                self.results[fname] = cached
+            else:
+                self.results[fname] = self.pool.apply_async(hashFile, (fname,))
+
+    def digests(self, fname):
+        """
+        Return the digests of a file, waiting for them if need be.
+        """
+        if fname not in self.results:
+            self.submit([fname])
+        result = self.results.pop(fname)
+        if isinstance(result, dict):
+            metrics.count('hash.cached')
+            return result
+        digests = result.get(MAX_WAIT)
+        metrics.count('hash.files')
+        metrics.count('hash.bytes', os.path.getsize(fname))
+        if self.cache:
+            self.cache.put(fname, digests)
+        return digests
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
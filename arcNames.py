@@ -0,0 +1,123 @@
+"""
+Parse Arc filenames into crawl, timestamp and part number, and convert the
+timestamps to ISO8601. Shared by processLists and insertArcMetadata.
+"""
+
+import re
+from datetime import datetime
+from time import strftime
+
+TNA_EXTRACTED_PATTERN = re.compile('^(.*\-(\d{4}))\-part\-(\d{8}).*$')
+GENERAL_PATTERN = re.compile('^(.*)[\-P](\d{6,17})[^\d](\d{1,5})?[^\d].*$')
+DAYS_IN_MONTH = (0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+MAX_CRAWLS = 100000     # crawl prefixes remembered
+
+crawls = {}
+
+def splitFilename(filename):
+    """
+    Match a filename against the pattern for its kind. Groups are the crawl
+    folder, the timestamp and the part number (if any); None if no match.
+    """
+    if filename[:14] == 'TNA-EXTRACTED-':
+        return TNA_EXTRACTED_PATTERN.match(filename)
+    return GENERAL_PATTERN.match(filename)
+
+def parseFilename(filename):
+    """
+    (crawl, timestamp, part) for a filename, or None if it does not parse.
+    Every file of a crawl gets the same crawl string object, so comparing
+    and storing folder names stays cheap.
+    """
+    parts = splitFilename(filename)
+    if not parts:
+        return None
+    crawl, timestamp, part = parts.groups()
+    if crawl in crawls:
+        crawl = crawls[crawl]
+    else:
+        if len(crawls) >= MAX_CRAWLS:
+            crawls.clear()
+        crawls[crawl] = crawl
+    return crawl, timestamp, part
+
+def sortKey(filename):
+    """
+    (crawl, timestamp, part number) to sort filenames by, so that each crawl
+    comes together in time order. A name that does not parse is a crawl of
+    its own.
+    """
+    parts = parseFilename(filename)
+    if not parts:
+        return filename, '', -1
+    crawl, timestamp, part = parts
+    return crawl, timestamp, int(part) if part else -1
+
+def listKey(line):
+    """
+    sortKey for a line of a file list, which may be a path or url.
+    """
+    return sortKey(line.split('/')[-1].rstrip())
+
+def validDate(year, month, day):
+    if year < 1900 or not 1 <= month <= 12:
+        return False
+    if month == 2 and day == 29:
+        return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    return 1 <= day <= DAYS_IN_MONTH[month]
+
+def validTime(date):
+    return int(date[0:2]) < 24 and int(date[2:4]) < 60 and int(date[4:6]) < 60
+
+def dateConvert(date):
+    """
+    Convert multiple date formats to ISO8601 Probably false assumption made
+    that times are UTC.
+    The timestamps are fixed-width digit strings, so they are sliced rather
+    than parsed; anything the slicing cannot vouch for goes the slow way.
+    """
+    n = len(date)
+    if n == 4:
+        return date
+    if not date.isdigit():
+        return slowDateConvert(date)
+    if n == 8:
+        if validDate(int(date[0:4]), int(date[4:6]), int(date[6:8])):
+            return date[0:4] + '-' + date[4:6] + '-' + date[6:8]
+    elif n == 12:
+        # %y: 69-99 are 1969-1999, 00-68 are 2000-2068
+        year = int(date[0:2])
+        century = '19' if year >= 69 else '20'
+        if validDate(int(century + date[0:2]), int(date[2:4]), int(date[4:6])) \
+           and validTime(date[6:12]):
+            return century + date[0:2] + '-' + date[2:4] + '-' + date[4:6] + \
+                   'T' + date[6:8] + ':' + date[8:10] + ':' + date[10:12] + 'Z'
+    elif n == 14 or n == 17:
+        if validDate(int(date[0:4]), int(date[4:6]), int(date[6:8])) \
+           and validTime(date[8:14]):
+            return date[0:4] + '-' + date[4:6] + '-' + date[6:8] + \
+                   'T' + date[8:10] + ':' + date[10:12] + ':' + date[12:14] + 'Z'
+    else:
+        return '*' + date # should never happen
+    return slowDateConvert(date)
+
+def slowDateConvert(date):
+    """
+    The original strptime/strftime conversion, kept for odd dates so that
+    they convert (or fail) exactly as they always have.
+    """
+    # just a year
+    if len(date) == 4:
+        date = date
+    elif len(date) == 8:
+        date_object = datetime.strptime(date, '%Y%m%d')
+        date = strftime('%Y-%m-%d', date_object.timetuple())
+    elif len(date) == 12:
+        date_object = datetime.strptime(date, '%y%m%d%H%M%S')
+        date = strftime('%Y-%m-%dT%H:%M:%SZ', date_object.timetuple())
+    elif (len(date) == 14) or (len(date) == 17) :
+        date_object = datetime.strptime(date[:14], '%Y%m%d%H%M%S')
+        date = strftime('%Y-%m-%dT%H:%M:%SZ', date_object.timetuple())
+    else:
+        date = '*' + date # should never happen
+    return date
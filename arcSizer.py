@@ -0,0 +1,357 @@
+"""
+Find the sizes of remote Arc files with HEAD requests, sent concurrently
+over a pool of keep-alive connections and paced by an adaptive rate limit
+rather than a fixed random sleep. Redirects are learnt, so that most urls
+can be sized with one HEAD to where they would have been redirected.
+"""
+
+import time, threading
+from collections import deque
+from multiprocessing.pool import ThreadPool
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from sizeCache import SizeEntry
+import metrics
+
+USER_AGENT = 'processLists'
+HEAD_TIMEOUT = 60       # seconds to wait for a single HEAD response
+MAX_RETRIES = 5         # retries for a HEAD answered with 429 or 5xx
+DEFAULT_WORKERS = 8     # concurrent HEAD requests
+DEFAULT_RATE = 5.0      # starting requests per second, across all workers
+MIN_RATE = 0.2
+MAX_RATE = 50.0
+WINDOW = 50             # responses judged together when adjusting the rate
+BASELINE_WINDOWS = 20   # recent windows the usual latency is taken from
+SLOWDOWN = 2.0          # a window this many times slower than the baseline is overload
+MIN_SLOWDOWN = 0.05     # ... and slower by at least this many seconds
+LEARN_AFTER = 2         # agreeing redirects before a learnt prefix is used
+SPOT_CHECK = 100        # every this many predicted locations, check the redirect
+# AsyncResult.get() without a timeout cannot be interrupted under python 2
+MAX_WAIT = 7 * 24 * 3600
+
+class AdaptiveThrottle(object):
+    """
+    Space out request starts across all threads. The rate creeps up while
+    the server answers quickly, and is cut back on 429/5xx responses or when
+    latency climbs well above its usual level (do not stress the server).
+    Latency is judged a window of WINDOW responses at a time, by the median,
+    against a baseline of the lowest of the last BASELINE_WINDOWS medians,
+    so single slow responses do not count; the rate is cut at most once a
+    window, and only raised after a window that was not cut.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, minRate=MIN_RATE, maxRate=MAX_RATE):
+        self.rate = rate
+        self.minRate = minRate
+        self.maxRate = maxRate
+        # median response times, seconds, of recent windows
+        self.medians = deque(maxlen=BASELINE_WINDOWS)
+        # response times of the current window
+        self.window = []
+        # responses since the rate was last cut
+        self.sinceCut = WINDOW
+        self.nextSlot = time.time()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block until the calling thread may start its next request.
+        """
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.nextSlot)
+            self.nextSlot = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+    def record(self, status, latency, retryAfter=None):
+        """
+        Adjust the rate from the outcome of one request; a status of None is
+        a request that got no response at all (a timeout or a dropped
+        connection), taken as overload like a 5xx.
+        """
+        with self.lock:
+            self.sinceCut += 1
+            if status is None or status == 429 or status >= 500:
+                self.cut(0.5)
+                if retryAfter:
+                    self.nextSlot = max(self.nextSlot, time.time() + retryAfter)
+                return
+            self.window.append(latency)
+            if len(self.window) < WINDOW:
+                return
+            self.window.sort()
+            median = self.window[WINDOW // 2]
+            self.window = []
+            if self.medians:
+                # the windows just after a cut keep the baseline near the
+                # unloaded latency; a lasting slowdown ages in
+                baseline = min(self.medians)
+                if median > max(SLOWDOWN * baseline, baseline + MIN_SLOWDOWN):
+                    self.cut(0.8)
+            if self.sinceCut >= WINDOW:
+                self.rate = min(self.maxRate, self.rate + 0.1 * WINDOW)
+            self.medians.append(median)
+
+    def cut(self, factor):
+        """
+        Cut the rate by factor, unless it was cut less than a window ago:
+        every request in flight when the server slowed sees it, and the
+        cut is made once for all of them.
+        """
+        if self.sinceCut >= WINDOW:
+            self.rate = max(self.minRate, self.rate * factor)
+            self.sinceCut = 0
+
+def commonTail(url, location):
+    """
+    The longest ending the url shares with its location that starts just
+    after a '/' in the url (at least the filename, usually), or None.
+    """
+    n = 0
+    while n < min(len(url), len(location)) and url[-1 - n] == location[-1 - n]:
+        n += 1
+    start = len(url) - n
+    if start > 0 and url[start - 1] != '/':
+        start = url.find('/', start) + 1
+        if start == 0:
+            return None
+    return url[start:] or None
+
+class RedirectMap(object):
+    """
+    Redirects learnt by url prefix: when a url redirects to a location with
+    the same tail, the prefixes before the tail are remembered, and once
+    LEARN_AFTER redirects agree, other urls under the same prefix can be
+    sent straight to the location they would be redirected to.
+    """
+
+    def __init__(self):
+        # source prefix -> [target prefix, agreeing redirects]
+        self.prefixes = {}
+        self.lock = threading.Lock()
+
+    def learn(self, url, location):
+        tail = commonTail(url, location)
+        if tail is None:
+            return
+        source = url[:len(url) - len(tail)]
+        target = location[:len(location) - len(tail)]
+        with self.lock:
+            entry = self.prefixes.get(source)
+            if entry and entry[0] == target:
+                entry[1] += 1
+            else:
+                self.prefixes[source] = [target, 1]
+
+    def predict(self, url):
+        """
+        Where url should redirect to, or None if no prefix of it is known.
+        """
+        with self.lock:
+            cut = url.rfind('/')
+            while cut >= 0:
+                entry = self.prefixes.get(url[:cut + 1])
+                if entry:
+                    return entry[0] + url[cut + 1:] if entry[1] >= LEARN_AFTER else None
+                cut = url.rfind('/', 0, cut)
+        return None
+
+    def forget(self, url):
+        """
+        Stop predicting for the prefix of url, which led somewhere wrong.
+        """
+        with self.lock:
+            cut = url.rfind('/')
+            while cut >= 0:
+                if self.prefixes.pop(url[:cut + 1], None):
+                    return
+                cut = url.rfind('/', 0, cut)
+
+class ArcSizer(object):
+    """
+    Size Arc files over HTTP using one shared requests Session, so that
+    every HEAD (and every 302 follow-up) reuses a pooled connection.
+    If a SizeCache is given, known sizes are taken from it and only stale
+    entries are checked against the server. Unless learn is False, urls
+    whose redirect can be predicted are sized at the predicted location
+    (falling back to the url on a 404 or anything else unexpected). Sizes a
+    SizeManifest gives are taken from it, before the cache.
+    """
+
+    def __init__(self, uname, pwd, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE, cache=None,
+                 learn=True, manifest=None):
+        self.workers = workers
+        self.cache = cache
+        self.manifest = manifest
+        self.redirects = RedirectMap() if learn else None
+        self.predictions = 0
+        self.lock = threading.Lock()
+        self.throttle = AdaptiveThrottle(rate)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-agent'] = USER_AGENT
+        self.session.auth = HTTPBasicAuth(uname, pwd)
+
+    def head(self, url, headers=None):
+        """
+        Make one throttled HEAD call, retrying while the server is overloaded
+        or does not answer. A request that still fails after MAX_RETRIES
+        retries raises its requests.RequestException.
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            self.throttle.wait()
+            started = time.time()
+            try:
+                h = self.session.head(url, headers=headers, allow_redirects=False,
+                                      timeout=HEAD_TIMEOUT)
+            except requests.RequestException as e:
+                self.throttle.record(None, time.time() - started)
+                metrics.count('head.requests')
+                metrics.count('head.failed')
+                print "[WARN] HEAD %s failed : %s" % (url, e)
+                if attempt == MAX_RETRIES:
+                    raise
+                metrics.count('head.retries')
+                continue
+            retryAfter = h.headers.get('Retry-After', '')
+            retryAfter = int(retryAfter) if retryAfter.isdigit() else None
+            latency = time.time() - started
+            self.throttle.record(h.status_code, latency, retryAfter)
+            metrics.count('head.requests')
+            metrics.count('head.status.%d' % h.status_code)
+            metrics.observe('head.latency', latency)
+            if not (h.status_code == 429 or h.status_code >= 500):
+                break
+            metrics.count('head.retries')
+        return h
+
+    def lookup(self, url, cached=None):
+        """
+        HEAD an Arc file url, following a 302, and return its SizeEntry, or
+        None if the server gives no content-length. A cached entry is
+        revalidated with a conditional HEAD to its resolved location, and a
+        200 there is taken as the new size without looking it up again. A url
+        whose redirect has been learnt is sized at the predicted location,
+        except every SPOT_CHECK'th, which is checked against the real redirect.
+        """
+        if cached is not None:
+            validators = {}
+            if cached.etag:
+                validators['If-None-Match'] = cached.etag
+            if cached.lastModified:
+                validators['If-Modified-Since'] = cached.lastModified
+            h = self.head(cached.location or url, validators)
+            if h.status_code == 304:
+                metrics.count('size.revalidated')
+                return cached
+            # changed where it was: the 200 already has the new size
+            if h.status_code == 200 and 'content-length' in h.headers:
+                metrics.count('size.refreshed')
+                return SizeEntry(long(h.headers['content-length']), cached.location,
+                                 h.headers.get('ETag', ''), h.headers.get('Last-Modified', ''))
+        predicted = self.redirects.predict(url) if self.redirects else None
+        if predicted:
+            with self.lock:
+                self.predictions += 1
+                check = self.predictions % SPOT_CHECK == 0
+            h = self.head(predicted)
+            if h.status_code == 200 and 'content-length' in h.headers and not check:
+                metrics.count('head.predicted')
+                return SizeEntry(long(h.headers['content-length']), predicted,
+                                 h.headers.get('ETag', ''), h.headers.get('Last-Modified', ''))
+            if h.status_code != 200:
+                metrics.count('head.mispredicted')
+                self.redirects.forget(url)
+                predicted = None
+        h = self.head(url)
+        location = ''
+        if h.status_code == 302:
+            location = h.headers['Location']
+            metrics.count('head.redirects')
+            if predicted and location != predicted:
+                metrics.count('head.mispredicted')
+                self.redirects.forget(url)
+            if self.redirects:
+                self.redirects.learn(url, location)
+            h = self.head(location)
+        if 'content-length' in h.headers:
+            return SizeEntry(long(h.headers['content-length']), location,
+                             h.headers.get('ETag', ''), h.headers.get('Last-Modified', ''))
+        else:
+            print "[ERROR] HTTP Status : %s" % h.status_code
+            print "[DEBUG] HTTP Header : %s" % h.headers
+            return None
+
+    def getArcSize(self, url):
+        """
+        find the size of an Arc file, from the cache or by making a HEAD call
+        to the url and parsing the result.
+        """
+        url = url.strip()
+        known = self.manifest.get(url) if self.manifest else None
+        if known is not None:
+            return known
+        cached, fresh = self.cache.get(url) if self.cache else (None, False)
+        if fresh:
+            return cached.size
+        return self.store(url, self.lookup(url, cached))
+
+    def store(self, url, entry):
+        """
+        Record a looked-up entry in the cache, and return its size (0 if the
+        lookup failed, which is never cached). Entries that came from the
+        cache are passed with no url, and left as they were.
+        """
+        if entry is None:
+            return 0
+        if self.cache and url:
+            self.cache.put(url, entry)
+        return entry.size
+
+    def sizeAll(self, lines):
+        """
+        Size every line of an input list, yielding (line, size) pairs in
+        input order. At most a few batches of requests are in flight, so
+        the list is never read into memory. The cache is only touched from
+        this (the calling) thread.
+        """
+        pool = ThreadPool(self.workers)
+        pending = deque()
+        try:
+            for line in lines:
+                url = line.strip()
+                known = self.manifest.get(url) if self.manifest else None
+                cached, fresh = None, False
+                if known is None and self.cache:
+                    cached, fresh = self.cache.get(url)
+                if known is not None:
+                    metrics.count('size.manifest')
+                    pending.append((line, None, Known(SizeEntry(known, '', '', ''))))
+                elif fresh:
+                    metrics.count('size.cached')
+                    pending.append((line, None, Known(cached)))
+                else:
+                    pending.append((line, url, pool.apply_async(self.lookup, (url, cached))))
+                if len(pending) >= 4 * self.workers:
+                    line, url, result = pending.popleft()
+                    yield line, self.store(url, result.get(MAX_WAIT))
+            while pending:
+                line, url, result = pending.popleft()
+                yield line, self.store(url, result.get(MAX_WAIT))
+        finally:
+            pool.terminate()
+
+class Known(object):
+    """
+    Stands in for the AsyncResult of a lookup answered from the cache.
+    """
+
+    def __init__(self, entry):
+        self.entry = entry
+
+    def get(self, timeout=None):
+        return self.entry
@@ -0,0 +1,517 @@
+#!/usr/bin/python
+"""
+Benchmarks for the transfer scripts, on synthetic lists of Arc names (and
+fake Arc files, and a local HTTP stub standing in for the source archive).
+The micro-benchmarks (names, rows) time the current code against the way
+it used to be done, and check that both give identical output. The script
+benchmarks (sizing, insert, folders, notes) each run one script's main
+loop in a child process, reporting rows/s, HEAD requests/s or hashing
+MB/s, and peak RSS.
+"""
+
+from getopt import getopt, GetoptError
+from csv import DictReader, DictWriter
+import sys, os, re, time, random, tempfile, resource, shutil, zlib, threading, traceback
+import BaseHTTPServer, SocketServer
+from datetime import datetime
+from time import strftime
+from multiprocessing import Pool, Process, Queue
+import arcNames
+import processLists, insertArcMetadata, modifyMetadataFolderNames, addArchivistNotes
+from arcSizer import ArcSizer, AdaptiveThrottle, DEFAULT_WORKERS
+from arcHasher import ArcHasher
+from metadataRow import FIELDS, NOTE_FIELDS, metadataReader, metadataWriter, blankRow, \
+     IDENTIFIER, FILENAME, FOLDER, DATE_CREATED, CHECKSUM, CRAWL_START, FILESIZE, UNIT
+
+DEFAULT_LATENCY = 10        # ms the HTTP stub takes to answer
+STUB_MAX_SIZE = 1024 * 1024 # largest Arc size the stub reports, so 10M rows fit the units
+STUB_RATE = 100000.0        # HEAD/s allowed against the stub, which needs no protecting
+DEFAULT_ARCS = 100          # fake Arc files to insert and hash
+DEFAULT_ARC_SIZE = 4 * 1024 * 1024
+
+def syntheticNames(count, seed=0):
+    """
+    Arc filenames in the shapes the filename patterns handle: general
+    crawl-timestamp-part names with 6 to 17 digit timestamps, TNA-EXTRACTED
+    names and BL names, with the odd one that does not parse at all.
+    """
+    rnd = random.Random(seed)
+    names = []
+    crawl = 0
+    while len(names) < count:
+        crawl += 1
+        kind = rnd.randint(0, 9)
+        year = rnd.randint(1996, 2013)
+        for part in range(rnd.randint(1, 200)):
+            stamp = '%04d%02d%02d%02d%02d%02d%03d' % (year, rnd.randint(1, 12), \
+                    rnd.randint(1, 28), rnd.randint(0, 23), rnd.randint(0, 59), \
+                    rnd.randint(0, 59), rnd.randint(0, 999))
+            if kind == 0:
+                names.append('TNA-EXTRACTED-crawl%d-%04d-part-%08d.arc.gz' % (crawl, year, part))
+            elif kind == 1:
+                names.append('BL-%06d_%d-%s-%05d.arc.gz' % (crawl, part % 3, stamp[:14], part))
+            elif kind == 2:
+                names.append('IAH-crawl%d-%s-%05d.arc.gz' % (crawl, stamp[2:14], part))
+            elif kind == 3:
+                names.append('ukgov%dP%s.arc' % (crawl, stamp[:8] + '_'))
+            elif kind == 4:
+                names.append('nonfit_%d_%d.arc.gz' % (crawl, part))
+            else:
+                names.append('crawl%d-%s-%05d.arc.gz' % (crawl, stamp[:rnd.choice((14, 17))], part))
+    return names[:count]
+
+def referenceSplitFilename(filename):
+    # the pattern compiled for every name, as processLists used to
+    if filename[:14] == 'TNA-EXTRACTED-':
+        pattern = re.compile('^(.*\-(\d{4}))\-part\-(\d{8}).*$')
+    else:
+        pattern = re.compile('^(.*)[\-P](\d{6,17})[^\d](\d{1,5})?[^\d].*$')
+    return re.match(pattern, filename)
+
+def referenceDateConvert(date):
+    # strptime/strftime for every date, as processLists used to
+    if len(date) == 4:
+        date = date
+    elif len(date) == 8:
+        date_object = datetime.strptime(date, '%Y%m%d')
+        date = strftime('%Y-%m-%d', date_object.timetuple())
+    elif len(date) == 12:
+        date_object = datetime.strptime(date, '%y%m%d%H%M%S')
+        date = strftime('%Y-%m-%dT%H:%M:%SZ', date_object.timetuple())
+    elif (len(date) == 14) or (len(date) == 17) :
+        date_object = datetime.strptime(date[:14], '%Y%m%d%H%M%S')
+        date = strftime('%Y-%m-%dT%H:%M:%SZ', date_object.timetuple())
+    else:
+        date = '*' + date # should never happen
+    return date
+
+def parseReference(names):
+    out = []
+    for name in names:
+        parts = referenceSplitFilename(name)
+        if parts:
+            out.append((parts.group(1), referenceDateConvert(parts.group(2)), parts.group(3)))
+        else:
+            out.append(None)
+    return out
+
+def parseCurrent(names):
+    out = []
+    for name in names:
+        parts = arcNames.parseFilename(name)
+        if parts:
+            out.append((parts[0], arcNames.dateConvert(parts[1]), parts[2]))
+        else:
+            out.append(None)
+    return out
+
+def timed(label, count, fn, *args):
+    started = time.time()
+    result = fn(*args)
+    elapsed = time.time() - started
+    print "[INFO] %-24s %10.0f rows/s (%.2fs)" % (label, count / elapsed, elapsed)
+    return result
+
+def benchNames(count, opts=None):
+    """
+    Filename parsing and date conversion, old path against arcNames.
+    """
+    names = syntheticNames(count)
+    old = timed('names: reference', count, parseReference, names)
+    new = timed('names: arcNames', count, parseCurrent, names)
+    if old != new:
+        print "[ERROR] names: outputs differ"
+        sys.exit(1)
+    # dates the slicing must hand back to strptime, or reject the same way
+    for date in ('20080230', '20080229', '19000229', '18991231', '000101000000',
+                 '690101000000', '20081301235959', '20081231240000', '12345'):
+        try:
+            expected = referenceDateConvert(date)
+        except ValueError:
+            expected = ValueError
+        try:
+            actual = arcNames.dateConvert(date)
+        except ValueError:
+            actual = ValueError
+        if expected != actual:
+            print "[ERROR] names: %s converts differently" % date
+            sys.exit(1)
+    print "[INFO] names: outputs identical"
+
+def syntheticMetadata(fname, count):
+    """
+    Write a metadata file of about count rows, shaped like processLists output.
+    A folder that turns up more than once keeps its first crawl_start.
+    """
+    with open(fname, "wb") as fho:
+        writer = metadataWriter(fho)
+        crawl = None
+        starts = {}
+        for name in syntheticNames(count):
+            parts = arcNames.parseFilename(name)
+            folder = parts[0] if parts else name
+            if folder != crawl:
+                crawl = folder
+                row = blankRow()
+                row[IDENTIFIER] = 'file:///T:WORK/RW_32/content/' + folder
+                row[FILENAME] = folder
+                row[FOLDER] = 'folder'
+                row[CRAWL_START] = starts.setdefault(folder, \
+                                   arcNames.dateConvert(parts[1]) if parts else '')
+                writer.writerow(row)
+            row = blankRow()
+            row[IDENTIFIER] = 'file:///T:WORK/RW_32/content/' + folder + '/' + name
+            row[FILENAME] = name
+            row[FOLDER] = 'file'
+            row[DATE_CREATED] = arcNames.dateConvert(parts[1]) if parts else ''
+            row[CRAWL_START] = starts.setdefault(folder, row[DATE_CREATED])
+            row[CHECKSUM] = '[checksum]'
+            row[FILESIZE] = len(name) * 1000003
+            row[UNIT] = 246
+            writer.writerow(row)
+
+def rewriteDicts(ifname, ofname):
+    # DictReader/DictWriter, as all the scripts used to
+    with open(ifname, "rb") as fhi, open(ofname, "wb") as fho:
+        reader = DictReader(fhi, fieldnames=FIELDS)
+        writer = DictWriter(fho, delimiter=',', fieldnames=FIELDS)
+        writer.writerow(dict((fn,fn) for fn in FIELDS))
+        next(reader, None)
+        for row in reader:
+            if row['folder'] == 'file':
+                row['checksum'] = row['checksum']
+            writer.writerow(row)
+
+def rewriteRows(ifname, ofname):
+    with open(ifname, "rb") as fhi, open(ofname, "wb") as fho:
+        writer = metadataWriter(fho)
+        for row in metadataReader(fhi):
+            if row[FOLDER] == 'file':
+                row[CHECKSUM] = row[CHECKSUM]
+            writer.writerow(row)
+
+def heldRowsMemory(kind, count):
+    """
+    Bytes of peak RSS taken by holding count file rows, as groupFiles holds
+    a crawl, built the old way (dicts) or the new way (lists). Run in a
+    child process, so each kind starts from the same baseline.
+    """
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    template = dict((fn, '') for fn in FIELDS)
+    rows = []
+    for i in xrange(count):
+        row = template.copy() if kind == 'dicts' else blankRow()
+        if kind == 'dicts':
+            row['filename'] = 'crawl-%014d-%05d.arc.gz' % (i, i % 100000)
+            row['filesize'] = i
+        else:
+            row[FILENAME] = 'crawl-%014d-%05d.arc.gz' % (i, i % 100000)
+            row[FILESIZE] = i
+        rows.append(row)
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) * 1024
+
+def benchRows(count, opts=None):
+    """
+    Streaming a metadata file through DictReader/DictWriter against the
+    positional metadataRow reader and writer, and the memory each row
+    representation takes when held.
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        source = os.path.join(tmpdir, 'metadata.csv')
+        syntheticMetadata(source, count)
+        timed('rows: dicts', count, rewriteDicts, source, os.path.join(tmpdir, 'dicts.csv'))
+        timed('rows: metadataRow', count, rewriteRows, source, os.path.join(tmpdir, 'rows.csv'))
+        with open(os.path.join(tmpdir, 'dicts.csv'), "rb") as a, \
+             open(os.path.join(tmpdir, 'rows.csv'), "rb") as b:
+            if a.read() != b.read():
+                print "[ERROR] rows: outputs differ"
+                sys.exit(1)
+        print "[INFO] rows: outputs identical"
+        for kind in ('dicts', 'lists'):
+            pool = Pool(1)
+            held = pool.apply(heldRowsMemory, (kind, count))
+            pool.close()
+            print "[INFO] rows: %-18s %10.0f bytes/row held" % (kind, float(held) / count)
+    finally:
+        for fname in os.listdir(tmpdir):
+            os.remove(os.path.join(tmpdir, fname))
+        os.rmdir(tmpdir)
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Answer HEAD requests as the source archive does: /src/ urls are
+    redirected to /store/, which gives a content-length made from the path.
+    """
+    protocol_version = 'HTTP/1.1'
+    # send each response in one write, or delayed ACKs stall keep-alive
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_HEAD(self):
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+        if self.path.startswith('/src/'):
+            self.send_response(302)
+            self.send_header('Location', self.server.base + '/store/' + self.path[5:])
+            self.send_header('Content-Length', '0')
+        else:
+            length = (zlib.crc32(self.path) & 0xffffffff) % STUB_MAX_SIZE + 1
+            self.send_response(200)
+            self.send_header('Content-Length', str(length))
+            self.send_header('ETag', '"%x"' % length)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Local HTTP server for the sizing benchmark, answering after latency
+    seconds. Counts the requests it is sent.
+    """
+    daemon_threads = True
+
+    def __init__(self, latency=DEFAULT_LATENCY / 1000.0, port=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), StubHandler)
+        self.latency = latency
+        self.base = 'http://127.0.0.1:%d' % self.server_address[1]
+        self.url = self.base + '/src/'
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+def fakeArcs(dirname, names, arcSize):
+    """
+    Write a file of arcSize bytes for each name, returning their paths.
+    The files will mostly be in the page cache, so hashing them measures
+    the CPU rather than the disk.
+    """
+    os.makedirs(dirname)
+    block = os.urandom(min(arcSize, 1024 * 1024))
+    paths = []
+    for name in names:
+        path = os.path.join(dirname, name)
+        with open(path, "wb") as fh:
+            left = arcSize
+            while left > 0:
+                fh.write(block[:left])
+                left -= len(block)
+        paths.append(path)
+    return paths
+
+def isolated(fn, *args):
+    """
+    Run fn(*args) in a child process, so that each benchmark's peak RSS is
+    its own, and return the dict it returns with 'rss' (bytes) added. The
+    scripts' progress output is thrown away.
+    """
+    queue = Queue()
+    child = Process(target=runChild, args=(queue, fn, args))
+    child.start()
+    result = queue.get()
+    child.join()
+    if 'error' in result:
+        print "[ERROR] %s" % result['error']
+        sys.exit(1)
+    return result
+
+def runChild(queue, fn, args):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        result = fn(*args)
+    except Exception:
+        result = {'error': traceback.format_exc()}
+    finally:
+        sys.stdout = stdout
+    result['rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    queue.put(result)
+
+def report(label, result):
+    elapsed = result['elapsed']
+    print "[INFO] %-24s %10.0f rows/s (%.2fs)" % (label, result['rows'] / elapsed, elapsed)
+    if 'requests' in result:
+        print "[INFO] %-24s %10.0f HEAD/s (%d requests)" % (label, \
+              result['requests'] / elapsed, result['requests'])
+    if 'hashed' in result:
+        print "[INFO] %-24s %10.1f MB/s hashed" % (label, result['hashed'] / elapsed / 1048576)
+    print "[INFO] %-24s %10.0f MB peak RSS" % (label, result['rss'] / 1048576.0)
+
+def runSizing(count, opts):
+    tmpdir = tempfile.mkdtemp()
+    server = StubServer(opts['latency'])
+    server.start()
+    try:
+        listname = os.path.join(tmpdir, 'list.txt')
+        with open(listname, "wb") as fh:
+            for name in syntheticNames(count):
+                fh.write(server.url + name + '\n')
+        sizer = ArcSizer('user', 'password', opts['workers'])
+        sizer.throttle = AdaptiveThrottle(STUB_RATE, maxRate=STUB_RATE)
+        started = time.time()
+        with open(listname, "rb") as fhi, open(os.path.join(tmpdir, 'out.csv'), "wb") as fho:
+            processLists.groupFiles(sizer.sizeAll(fhi), metadataWriter(fho))
+        elapsed = time.time() - started
+    finally:
+        server.shutdown()
+        shutil.rmtree(tmpdir)
+    return {'rows': count, 'elapsed': elapsed, 'requests': server.requests}
+
+def benchSizing(count, opts):
+    """
+    processLists: sizing a list with HEAD requests to the HTTP stub, each
+    redirected once, and grouping it into folders and units.
+    """
+    report('sizing: processLists', isolated(runSizing, count, opts))
+
+def runInsert(count, opts):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        source = os.path.join(tmpdir, 'metadata.csv')
+        syntheticMetadata(source, count)
+        names = [name for name in syntheticNames(count) if arcNames.parseFilename(name)]
+        names = names[::max(1, len(names) // opts['arcs'])][:opts['arcs']]
+        paths = fakeArcs(os.path.join(tmpdir, 'arcs'), names, opts['arcSize'])
+        files, paths = insertArcMetadata.readFileList(path + '\n' for path in paths)
+        hasher = ArcHasher(opts['processes'])
+        started = time.time()
+        try:
+            hasher.submit(paths)
+            with open(source, "rb") as fhi, open(os.path.join(tmpdir, 'out.csv'), "wb") as fho:
+                insertArcMetadata.insertFiles('user', 'password', files, metadataReader(fhi),
+                                              metadataWriter(fho), hasher)
+        finally:
+            hasher.close()
+        elapsed = time.time() - started
+    finally:
+        shutil.rmtree(tmpdir)
+    return {'rows': count + len(paths), 'elapsed': elapsed,
+            'hashed': len(paths) * opts['arcSize']}
+
+def benchInsert(count, opts):
+    """
+    insertArcMetadata: inserting and hashing fake Arc files.
+    """
+    report('insert: insertArcMetadata', isolated(runInsert, count, opts))
+
+def runFolders(count, opts):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        source = os.path.join(tmpdir, 'metadata.csv')
+        syntheticMetadata(source, count)
+        mountpoint = tmpdir + '/'
+        with open(source, "rb") as fhi:
+            for row in metadataReader(fhi):
+                folder = mountpoint + 'RW_32/content/' + row[FILENAME]
+                if row[FOLDER] == 'folder' and not os.path.isdir(folder):
+                    os.makedirs(folder)
+        started = time.time()
+        with open(source, "rb") as fhi:
+            plan = modifyMetadataFolderNames.renamePlan(mountpoint, metadataReader(fhi))
+        conflicts = modifyMetadataFolderNames.checkPlan(plan)
+        if conflicts:
+            raise ValueError(conflicts[0])
+        modifyMetadataFolderNames.runPlan(plan, os.path.join(tmpdir, 'renames'),
+                                          workers=opts['workers'])
+        with open(source, "rb") as fhi, open(os.path.join(tmpdir, 'out.csv'), "wb") as fho:
+            modifyMetadataFolderNames.modifyMetadata(mountpoint, metadataReader(fhi),
+                                                     metadataWriter(fho))
+        elapsed = time.time() - started
+    finally:
+        shutil.rmtree(tmpdir)
+    return {'rows': count, 'elapsed': elapsed}
+
+def benchFolders(count, opts):
+    """
+    modifyMetadataFolderNames: planning and making the folder moves, and
+    rewriting the metadata.
+    """
+    report('folders: modifyMetadata..', isolated(runFolders, count, opts))
+
+def runNotes(count, opts):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        source = os.path.join(tmpdir, 'metadata.csv')
+        syntheticMetadata(source, count)
+        corrupt = dict((name, ['2014-01-01', 'corrupt']) for name in syntheticNames(count)[::1000])
+        started = time.time()
+        with open(source, "rb") as fhi, open(os.path.join(tmpdir, 'out.csv'), "wb") as fho:
+            addArchivistNotes.modifyMetadata(metadataReader(fhi), corrupt,
+                                             metadataWriter(fho, NOTE_FIELDS))
+        elapsed = time.time() - started
+    finally:
+        shutil.rmtree(tmpdir)
+    return {'rows': count, 'elapsed': elapsed}
+
+def benchNotes(count, opts):
+    """
+    addArchivistNotes: merging a corrupt list of one file in a thousand.
+    """
+    report('notes: addArchivistNotes', isolated(runNotes, count, opts))
+
+BENCHMARKS = {'names': benchNames, 'rows': benchRows, 'sizing': benchSizing,
+              'insert': benchInsert, 'folders': benchFolders, 'notes': benchNotes}
+
+def main(argv):
+    names, counts, opts = getParms()
+    if opts['serve']:
+        server = StubServer(opts['latency'], opts['serve'])
+        print "[INFO] Serving Arc sizes at %s" % server.url
+        server.serve_forever()
+    for count in counts:
+        print "[INFO] %d rows" % count
+        for name in names:
+            BENCHMARKS[name](count, opts)
+
+def getParms():
+    """
+    Get command line parameters.
+    """
+    counts = [1000000]
+    opts = {'latency': DEFAULT_LATENCY / 1000.0, 'workers': DEFAULT_WORKERS,
+            'processes': None, 'arcs': DEFAULT_ARCS, 'arcSize': DEFAULT_ARC_SIZE,
+            'serve': 0}
+    try:
+        myopts, args = getopt(sys.argv[1:],"n:l:w:j:a:s:", ["serve="])
+    except GetoptError as e:
+        print (str(e))
+        usage()
+
+    for o, a in myopts:
+        if o == '-n':
+            counts = [int(n) for n in a.split(',')]
+        elif o == '-l':
+            opts['latency'] = float(a) / 1000
+        elif o == '-w':
+            opts['workers'] = int(a)
+        elif o == '-j':
+            opts['processes'] = int(a)
+        elif o == '-a':
+            opts['arcs'] = int(a)
+        elif o == '-s':
+            opts['arcSize'] = int(a) * 1024
+        elif o == '--serve':
+            opts['serve'] = int(a)
+
+    if not args:
+        args = sorted(BENCHMARKS)
+    if [name for name in args if name not in BENCHMARKS]:
+        usage()
+
+    return (args, counts, opts)
+
+def usage():
+    print("Usage: %s [-n count[,count...]] [-l latency_ms] [-w workers] [-j processes]" \
+          " [-a arcs] [-s arc_kb] [%s ...]" % (sys.argv[0], '|'.join(sorted(BENCHMARKS))))
+    print("       %s --serve port [-l latency_ms]" % sys.argv[0])
+    sys.exit(2)
+
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
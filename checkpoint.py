@@ -0,0 +1,47 @@
+"""
+Checkpoint journal for long processLists runs: one JSON line per completed
+crawl folder, recording how far the input and output files have got and
+the drive allocation state at that point.
+"""
+
+import os, json
+
+class Checkpoint(object):
+    """
+    Append checkpoints to a journal file. The output file is flushed to disk
+    before each entry is written, so an entry never points past data that
+    could be lost.
+    """
+
+    def __init__(self, path, fho, resume=False):
+        self.fho = fho
+        self.journal = open(path, "ab" if resume else "wb")
+
+    def save(self, state):
+        """
+        Record a state dict (input offset, runningTotal, unit, units,
+        nonfits) together with the current output offset.
+        """
+        self.fho.flush()
+        os.fsync(self.fho.fileno())
+        state = dict(state, output=self.fho.tell())
+        self.journal.write(json.dumps(state) + '\n')
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    def close(self):
+        self.journal.close()
+
+def loadCheckpoint(path):
+    """
+    Return the last complete state in a journal, or None if there is none.
+    """
+    state = None
+    try:
+        with open(path, "rb") as fhj:
+            for line in fhj:
+                if line.endswith('\n'):
+                    state = json.loads(line)
+    except IOError:
+        pass
+    return state
@@ -0,0 +1,129 @@
+#!/usr/bin/python
+"""
+Persistent cache of Arc file checksums, keyed by path and by file identity
+(device, inode, size, mtime), so that unchanged files are never re-read.
+Run as a script to prune entries for files that no longer exist.
+"""
+
+from getopt import getopt, GetoptError
+import sys, os, sqlite3
+from arcHasher import DIGESTS
+
+DEFAULT_CACHE = 'checksums.db'
+COMMIT_EVERY = 100      # puts between commits
+
+def fileIdentity(fname):
+    """
+    (device, inode, size, mtime) of a file; if any of these change the file
+    must be hashed again.
+    """
+    st = os.stat(fname)
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime)
+
+class ChecksumCache(object):
+    """
+    SQLite table of path and file identity -> digests. A file is found by
+    its path, or failing that by its identity, so a folder that has been
+    moved (see modifyMetadataFolderNames) still hits the cache.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE):
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS checksums ('
+                        'path TEXT PRIMARY KEY, dev INTEGER, inode INTEGER, '
+                        'size INTEGER, mtime REAL, %s)'
+                        % ', '.join('%s TEXT' % name for name in DIGESTS))
+        self.db.execute('CREATE INDEX IF NOT EXISTS checksums_identity '
+                        'ON checksums (dev, inode, size, mtime)')
+        self.uncommitted = 0
+
+    def get(self, fname):
+        """
+        Return the digests dict of a file, or None if it is new or changed.
+        """
+        fname = os.path.abspath(fname)
+        identity = fileIdentity(fname)
+        columns = ', '.join(DIGESTS)
+        row = self.db.execute('SELECT %s FROM checksums WHERE path = ? AND dev = ? '
+                              'AND inode = ? AND size = ? AND mtime = ?' % columns,
+                              (fname,) + identity).fetchone()
+        if row is None:
+            row = self.db.execute('SELECT %s FROM checksums WHERE dev = ? '
+                                  'AND inode = ? AND size = ? AND mtime = ?' % columns,
+                                  identity).fetchone()
+            if row is None:
+                return None
+            # known file under a new name
+            self.put(fname, dict(zip(DIGESTS, row)), identity)
+        return dict(zip(DIGESTS, row))
+
+    def put(self, fname, digests, identity=None):
+        fname = os.path.abspath(fname)
+        identity = identity or fileIdentity(fname)
+        self.db.execute('INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?, %s)'
+                        % ', '.join('?' * len(DIGESTS)),
+                        (fname,) + identity + tuple(digests[name] for name in DIGESTS))
+        self.uncommitted += 1
+        if self.uncommitted >= COMMIT_EVERY:
+            self.db.commit()
+            self.uncommitted = 0
+
+    def prune(self):
+        """
+        Remove entries for files that no longer exist, or that have changed
+        since they were hashed. Returns the number of entries removed.
+        """
+        stale = []
+        for row in self.db.execute('SELECT path, dev, inode, size, mtime FROM checksums'):
+            try:
+                if fileIdentity(row[0]) != tuple(row[1:]):
+                    stale.append(row[0])
+            except OSError:
+                stale.append(row[0])
+        self.db.executemany('DELETE FROM checksums WHERE path = ?', [(p,) for p in stale])
+        self.db.commit()
+        return len(stale)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+def main(argv):
+    cachename, prune = getParms()
+    cache = ChecksumCache(cachename)
+    try:
+        if prune:
+            print "[INFO] Pruned %d entries" % cache.prune()
+    finally:
+        cache.close()
+
+def getParms():
+    """
+    Get command line parameters.
+    """
+    cachename = DEFAULT_CACHE
+    prune = False
+    try:
+        myopts, args = getopt(sys.argv[1:],"c:", ["prune"])
+    except GetoptError as e:
+        print (str(e))
+        usage()
+
+    for o, a in myopts:
+        if o == '-c':
+            cachename = a
+        elif o == '--prune':
+            prune = True
+
+    if not prune:
+        usage()
+
+    return (cachename, prune)
+
+def usage():
+    print("Usage: %s [-c checksumcache] --prune" % sys.argv[0])
+    sys.exit(2)
+
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
@@ -0,0 +1,192 @@
+#!/usr/bin/python
+"""
+Find Arc files whose content is the same as a file earlier in the
+metadata (the same crawl delivered twice, as with BL re-deliveries under
+the same names in another folder, or a file carried over from one crawl
+to the next), by checksum, before the units are allocated. Each copy is
+flagged with an archivist note giving the identifier of the first file
+with its content, and given no unit; the units are then filled again
+without the copies, so they are neither stored nor transferred. Files
+that still have no checksum are hashed first, if a list of where they are
+is given (-f).
+"""
+
+from getopt import getopt, GetoptError
+import sys, time, tempfile
+from hurry.filesize import size
+from arcHasher import ArcHasher, DIGESTS
+from checksumCache import ChecksumCache, DEFAULT_CACHE as DEFAULT_CHECKSUMS
+from transferUnits import readSources
+from unitAllocator import allocateUnits, fillUnits
+from verifyUnits import DIGEST_LENGTHS
+from opensslStream import openMetadata
+from metadataRow import metadataReader, metadataWriter, isDuplicate, NOTE_FIELDS, \
+     IDENTIFIER, FILENAME, FOLDER, CHECKSUM, FILESIZE, UNIT, DATE_ARCHIVIST_NOTE, \
+     ARCHIVIST_NOTE, DUPLICATE_NOTE
+import metrics
+
+UNIT_SIZE = 1900000000000 # 1.9 TB (actual is 1,953,378,644,000). Needs python >= 2.5
+# list of available drives by label
+UNITS = range(246,256)
+
+def main(argv):
+    ifname, ofname, opts = getParms()
+    if opts['metrics']:
+        metrics.dumpAtExit(opts['metrics'])
+    counts = {'files': 0, 'bytes': 0}
+    checksums = hasher = None
+    try:
+        sources = {}
+        if opts['filelist']:
+            with openMetadata(opts['filelist'], "rb") as fhl:
+                sources = readSources(fhl)
+            checksums = ChecksumCache(opts['checksums'])
+            hasher = ArcHasher(opts['processes'], checksums)
+            with openMetadata(ifname, "rb") as fhi:
+                hasher.submit(unhashed(metadataReader(fhi), sources))
+        with openMetadata(ifname, "rb") as fhi, openMetadata(ofname, "wb") as fho:
+            print "[INFO] Opened files successfully."
+            rows = metadataReader(fhi)
+            if hasher:
+                rows = hashRows(rows, sources, hasher, opts['digest'])
+            rows = dedupeRows(rows, {}, counts)
+            writer = metadataWriter(fho, NOTE_FIELDS)
+            if opts['pack']:
+                spool = tempfile.TemporaryFile()
+                spoolWriter = metadataWriter(spool, NOTE_FIELDS)
+                for row in rows:
+                    spoolWriter.writerow(row)
+                spool.seek(0)
+                allocateUnits(spool, writer, UNITS, UNIT_SIZE)
+                spool.close()
+            else:
+                runningTotal = fillUnits(rows, writer, UNITS, UNIT_SIZE)
+                print "[INFO] Total arcs size : %s" % size(runningTotal)
+    except IOError as e:
+        print "[IOERROR] %s" % e
+        sys.exit(1)
+    except ValueError as e:
+        print "[ERROR] Can't allocate units : %s" % e
+        sys.exit(1)
+    finally:
+        if hasher:
+            hasher.close()
+            checksums.close()
+    print "[INFO] Duplicates : %d files, %s not stored" % (counts['files'], size(counts['bytes']))
+
+def hasChecksum(row):
+    """
+    Whether a file row has a real checksum, rather than the placeholder.
+    """
+    return len(row[CHECKSUM]) in DIGEST_LENGTHS
+
+def unhashed(rows, sources):
+    """
+    The paths of the files with no checksum yet that the file list has, in
+    metadata order.
+    """
+    return [sources[row[FILENAME]] for row in rows
+            if row[FOLDER] == 'file' and not hasChecksum(row) and row[FILENAME] in sources]
+
+def hashRows(rows, sources, hasher, digest='md5'):
+    """
+    Fill in the checksum (the chosen digest) of each file with none yet
+    that the file list has.
+    """
+    for row in rows:
+        if row[FOLDER] == 'file' and not hasChecksum(row) and row[FILENAME] in sources:
+            row[CHECKSUM] = hasher.digests(sources[row[FILENAME]])[digest]
+        yield row
+
+def dedupeRows(rows, index, counts):
+    """
+    Pass the rows through with the archivist note columns, flagging each
+    file with the checksum of a file before it as a duplicate of that
+    file and taking it off its unit. index is a dict of checksum -> the
+    identifier of the first file with it, so a copy under the same name
+    in another folder is found too; counts gets the files flagged and
+    their bytes. Files with no checksum are never flagged, and a file
+    flagged by an earlier run that is now the first with its checksum loses
+    the flag, so it is given a unit again.
+    """
+    today = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    for row in rows:
+        row += [''] * (len(NOTE_FIELDS) - len(row))
+        if row[FOLDER] == 'file' and hasChecksum(row):
+            checksum = row[CHECKSUM].lower()
+            first = index.setdefault(checksum, row[IDENTIFIER])
+            if first != row[IDENTIFIER]:
+                flag = DUPLICATE_NOTE + first
+                # a file flagged by an earlier run keeps its note and date
+                if not row[ARCHIVIST_NOTE].startswith(flag):
+                    note = otherNotes(row)
+                    row[DATE_ARCHIVIST_NOTE] = today
+                    row[ARCHIVIST_NOTE] = '; '.join(text for text in (flag, note) if text)
+                row[UNIT] = ''
+                counts['files'] += 1
+                counts['bytes'] += long(row[FILESIZE] or 0)
+                metrics.count('dedupe.files')
+                metrics.count('dedupe.bytes', long(row[FILESIZE] or 0))
+            elif isDuplicate(row):
+                # the copy it was flagged against has gone from before it
+                row[ARCHIVIST_NOTE] = otherNotes(row)
+                if not row[ARCHIVIST_NOTE]:
+                    row[DATE_ARCHIVIST_NOTE] = ''
+                metrics.count('dedupe.unflagged')
+        metrics.count('rows')
+        yield row
+
+def otherNotes(row):
+    """
+    The archivist note without the duplicate flag at its start, if any;
+    notes added after the flag are kept.
+    """
+    if not isDuplicate(row):
+        return row[ARCHIVIST_NOTE]
+    return row[ARCHIVIST_NOTE][len(DUPLICATE_NOTE):].partition('; ')[2]
+
+def getParms():
+    """
+    Get command line parameters.
+    """
+    ifile = ofile = ""
+    opts = {'filelist': '', 'processes': None, 'digest': 'md5', 'checksums': DEFAULT_CHECKSUMS,
+            'pack': False, 'metrics': ''}
+    try:
+        myopts, args = getopt(sys.argv[1:],"i:o:f:j:d:c:", ["pack", "metrics="])
+    except GetoptError as e:
+        print (str(e))
+        usage()
+
+    for o, a in myopts:
+        if o == '-i':
+            ifile = a
+        elif o == '-o':
+            ofile = a
+        elif o == '-f':
+            opts['filelist'] = a
+        elif o == '-j':
+            opts['processes'] = int(a)
+        elif o == '-d':
+            opts['digest'] = a
+        elif o == '-c':
+            opts['checksums'] = a
+        elif o == '--pack':
+            opts['pack'] = True
+        elif o == '--metrics':
+            opts['metrics'] = a
+
+    if not (ifile and ofile) or opts['digest'] not in DIGESTS:
+        usage()
+
+    return (ifile, ofile, opts)
+
+def usage():
+    print("Usage: %s -i metadata -o outputmetadata [-f filelist] [-j processes]" \
+          " [-d md5|sha256] [-c checksumcache] [--pack] [--metrics file.json]" % sys.argv[0])
+    print("Files with no checksum yet are hashed from the file list, if given")
+    sys.exit(2)
+
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
@@ -0,0 +1,100 @@
+"""
+Sort lists too big to sort in memory: the lines are sorted in runs of a
+bounded size, each run spilled to a temporary file, and the runs merged
+back together a line at a time, no more than MAX_RUNS at once.
+"""
+
+import heapq, os, tempfile
+
+DEFAULT_MEMORY = 256 * 1024 * 1024  # bytes of lines held in a run
+LINE_OVERHEAD = 200                 # rough bytes per held line beyond its text
+MAX_RUNS = 64                       # runs merged at once, each an open file
+
+def externalSort(lines, key, memory=DEFAULT_MEMORY, tmpdir=None):
+    """
+    Yield lines in order of key(line), keeping lines with equal keys in
+    their input order. Every line yielded ends in a newline. Runs are only
+    spilled to disk if the lines take more than memory bytes; past
+    MAX_RUNS runs they are merged in passes, MAX_RUNS at a time, so no
+    more than that many files are open however small memory is.
+    """
+    runs = []
+    merged = []
+    run = []
+    held = 0
+    try:
+        for line in lines:
+            if not line.endswith('\n'):
+                line += '\n'
+            run.append(line)
+            held += len(line) + LINE_OVERHEAD
+            if held >= memory:
+                runs.append(spillRun(run, key, tmpdir))
+                run = []
+                held = 0
+        run.sort(key=key)
+        if not runs:
+            for line in run:
+                yield line
+            return
+        if run:
+            runs.append(spillRun(run, key, tmpdir))
+            run = []
+        while len(runs) > MAX_RUNS:
+            # consecutive runs merge into one, so the runs stay in input order
+            while runs:
+                merged.append(mergeRuns(runs[:MAX_RUNS], key, tmpdir))
+                del runs[:MAX_RUNS]
+            runs, merged = merged, []
+        files = []
+        try:
+            for path in runs:
+                files.append(open(path, 'rb'))
+            for entry in heapq.merge(*[readRun(fh, key, index) for index, fh in enumerate(files)]):
+                yield entry[-1]
+        finally:
+            for fh in files:
+                fh.close()
+    finally:
+        for path in runs + merged:
+            os.remove(path)
+
+def spillRun(run, key, tmpdir=None):
+    """
+    Sort a run and write it to a temporary file, returning its path. The
+    file is closed; the caller removes it.
+    """
+    run.sort(key=key)
+    fd, path = tempfile.mkstemp(dir=tmpdir)
+    with os.fdopen(fd, 'wb') as fh:
+        fh.writelines(run)
+    return path
+
+def mergeRuns(paths, key, tmpdir=None):
+    """
+    Merge consecutive runs into one new run, returning its path, and
+    remove the runs merged.
+    """
+    fd, path = tempfile.mkstemp(dir=tmpdir)
+    files = []
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for run in paths:
+                files.append(open(run, 'rb'))
+            for entry in heapq.merge(*[readRun(fh, key, index) for index, fh in enumerate(files)]):
+                out.write(entry[-1])
+    except:
+        os.remove(path)
+        raise
+    finally:
+        for fh in files:
+            fh.close()
+    for run in paths:
+        os.remove(run)
+    return path
+
+def readRun(fh, key, index):
+    # runs hold consecutive stretches of the input, so ties go to the
+    # earlier run, then to the earlier line within it
+    for number, line in enumerate(fh):
+        yield key(line), index, number, line
@@ -4,163 +4,538 @@ Processes a list of arc file names to insert into a CSV file of
 metadata for each file, where these files have been accidentally
 ommitted from the original metadata.
 Assumes the file list groups crawls together in date ascending order,
-but the output after this will not be.
+but the output after this will not be. With --merge the list can be in
+any order: it is sorted (on disk if large) and each missing file is merged
+into its folder in date order, with crawl_start and crawl_end widened to
+cover it. With --delta the list is the complete list for a new release:
+files no longer listed are dropped, files whose size has changed are
+rehashed, and new files are merged in (new crawls at the end), going on
+to the units from the fill levels the previous release left them at.
 """
 
 from getopt import getopt, GetoptError
-from csv import DictWriter, DictReader
-import sys, re, requests, time, random
-from datetime import datetime
-from time import strftime
-from requests.auth import HTTPBasicAuth
+import sys, tempfile
 from hurry.filesize import size
+from arcSizer import ArcSizer
+from sizeCache import SizeCache
 from os import stat
-from hashlib import md5
+from arcHasher import ArcHasher, hashFile, DIGESTS
+from checksumCache import ChecksumCache, DEFAULT_CACHE as DEFAULT_CHECKSUMS
+from arcNames import splitFilename, parseFilename, sortKey, listKey, dateConvert
+from externalSort import externalSort, DEFAULT_MEMORY
+from unitAllocator import report
+import metrics
+from opensslStream import openMetadata
+from metadataRow import metadataReader, metadataWriter, blankRow, IDENTIFIER, \
+     FILENAME, FOLDER, DATE_CREATED, CHECKSUM, SERIES_NUMBER, CRAWL_START, \
+     CRAWL_END, FILESIZE, UNIT, FIELDS
 
 
 UNIT_SIZE = 1900000000000 # 1.9 TB (actual is 1,953,378,644,000). Needs python >= 2.5
 IDENTIFIER_BASE = 'file:///T:WORK/RW_32/content/'
+# list of available drives by label
+UNITS = range(246,256)
 
 def main(argv):
-    uname, pwd, filelist, ifname, ofname = getParms()
+    uname, pwd, filelist, ifname, ofname, opts = getParms()
+    if opts['metrics']:
+        metrics.dumpAtExit(opts['metrics'])
     # try opening the files    
     try:
         #scl enable python27 bash
         # to allow multiple openings on one line
-        with open(filelist, "rb") as fhl, open(ifname, "rb") as fhi, open(ofname, "wb") as fho:
-            # read in the list of filenames to insert
-            d = {}
-            for line in fhl:
-                fname = line.split('/')[-1].rstrip()
-                #filename points to folder
-                parts = splitFilename(fname)
-                crawldir = parts.group(1)
-                if crawldir in d:
-                    d[crawldir].append(line.rstrip())
-                else:
-                    d[crawldir] = [line.rstrip()]
-
-            fields = ['identifier','filename','folder','date_created','checksum', \
-                      'series_number','creating_body','crawl_start', 'crawl_end', \
-                      'filesize', 'unit']
-            reader = DictReader(fhi, fieldnames=fields)
-            writer = DictWriter(fho, delimiter=',', fieldnames=fields)
-            writer.writerow(dict((fn,fn) for fn in fields))
+        with openMetadata(filelist, "rb") as fhl, openMetadata(ifname, "rb") as fhi, \
+             openMetadata(ofname, "wb") as fho:
+            if opts['merge'] or opts['delta']:
+                fhs = tempfile.TemporaryFile()
+                index = sortFileList(fhl, fhs, opts['memory'])
+            else:
+                d, paths = readFileList(fhl)
+            reader = metadataReader(fhi)
+            writer = metadataWriter(fho, reader.fields)
             print "[INFO] Opened files successfully."
-            insertFiles(uname, pwd, d, reader, writer)
+            checksums = ChecksumCache(opts['checksums'])
+            hasher = ArcHasher(opts['processes'], checksums)
+            try:
+                if opts['delta']:
+                    with openMetadata(ifname, "rb") as fhp:
+                        fills, added = unitFills(index, fhs, metadataReader(fhp), hasher)
+                    deltaFiles(index, fhs, fills, added, reader, writer, hasher, opts['digest'])
+                elif opts['merge']:
+                    with openMetadata(ifname, "rb") as fhp:
+                        present = presentFiles(index, fhs, metadataReader(fhp))
+                    mergeFiles(index, fhs, present, reader, writer, hasher, opts['digest'])
+                else:
+                    # start hashing every file straight away, in list order
+                    hasher.submit(paths)
+                    insertFiles(uname, pwd, d, reader, writer, hasher, opts['digest'])
+            finally:
+                hasher.close()
+                checksums.close()
     except IOError as e:
-        print "[IOERROR] " + e
+        print "[IOERROR] %s" % e
+    except ValueError as e:
+        print "[ERROR] Can't allocate units : %s" % e
+        sys.exit(1)
 
-def insertFiles(uname, pwd, files, reader, writer):
+def readFileList(fhl):
+    """
+    Read in the list of filenames to insert, returning a dict of crawl
+    folder -> paths, and all the paths in list order.
+    """
+    d = {}
+    paths = []
+    for line in fhl:
+        fname = line.split('/')[-1].rstrip()
+        #filename points to folder
+        parts = splitFilename(fname)
+        crawldir = parts.group(1)
+        if crawldir in d:
+            d[crawldir].append(line.rstrip())
+        else:
+            d[crawldir] = [line.rstrip()]
+        paths.append(line.rstrip())
+    return d, paths
+
+def insertFiles(uname, pwd, files, reader, writer, hasher, digest='md5'):
     """
     Read in and write out each folder from the input metadata file until
     a folder containing missing files is found; then output the missing files, followed by the
-    rest of the folder
+    rest of the folder. Checksums (the chosen digest) come from the hasher.
+    """
+    for row in insertRows(files, reader, hasher, digest):
+        writer.writerow(row)
+        metrics.count('rows')
+        metrics.progress()
+    metrics.progress(final=True)
+
+def insertRows(files, rows, hasher, digest='md5'):
+    """
+    Pass metadata rows through, yielding the rows for the missing files
+    straight after their folder row. Later stages may change a row once it
+    has been yielded, so the folder row is copied first.
     """
+    for row in rows:
+        if row[FOLDER] != 'folder' or row[FILENAME] not in files:
+            yield row
+            continue
+        crawl = row[FILENAME]
+        print "found " + crawl
+        files_to_output = files[crawl]
+        uriBase = IDENTIFIER_BASE + crawl
+        # each new row starts from the one before, beginning with the folder
+        folder, row = row, row[:]
+        yield folder
+        for path in files_to_output:
+            row[CRAWL_START] = ''
+            row[CRAWL_END] = ''
+            filename = path.split('/')[-1]
+            parts = splitFilename(filename)
+            row[FILENAME] = filename
+            arcSize = getArcSize(path)
+            row[FILESIZE] = arcSize
+            row[IDENTIFIER] = uriBase + '/' + filename
+            row[FOLDER] = 'file'
+            date = dateConvert(parts.group(2))
+            row[DATE_CREATED] = date
+            row[CHECKSUM] = hasher.digests(path)[digest]
+            part = parts.group(3)
+            if part:
+                row[SERIES_NUMBER] = part
+            # unit is already populated
+            row, inserted = row[:], row
+            yield inserted
 
-    blankRow = {'identifier':'', 'filename':'', 'folder': '', 'date_created':'', \
-                'checksum':'', 'series_number':'', 'creating_body':'IMF', \
-                'crawl_start':'', 'crawl_end':'', 'filesize':'', 'unit':''}
+def sortFileList(fhl, fhs, memory=DEFAULT_MEMORY):
+    """
+    Write the list of files to insert to fhs sorted by crawl, timestamp and
+    part, returning a dict of crawl folder -> [offset, count] of its paths
+    in fhs. Only that index is kept in memory. A file whose name does not
+    parse is a folder of its own, of the same name, as groupFiles makes it.
+    """
+    index = {}
+    for line in externalSort(fhl, listKey, memory):
+        path = line.rstrip()
+        if not path:
+            continue
+        filename = path.split('/')[-1]
+        parts = parseFilename(filename)
+        crawl = parts[0] if parts else filename
+        if crawl not in index:
+            index[crawl] = [fhs.tell(), 0]
+        index[crawl][1] += 1
+        fhs.write(path + '\n')
+    return index
+
+def crawlPaths(fhs, entry):
+    """
+    The paths to insert into one folder, in order.
+    """
+    offset, count = entry
+    fhs.seek(offset)
+    return [fhs.readline().rstrip('\n') for i in xrange(count)]
 
-    # skip header row
-    next(reader, None)
-    for row in reader:
+def crawlDates(keys):
+    """
+    crawl_start and crawl_end for a folder from the sortKeys of its files,
+    in order; blank for a file whose name does not parse.
+    """
+    if not keys[0][1]:
+        return '', ''
+    return dateConvert(keys[0][1]), dateConvert(keys[-1][1])
+
+def presentFiles(index, fhs, rows):
+    """
+    First pass of a merge: a dict of crawl folder -> the files in the list
+    that the folder already has, wherever among its rows they are.
+    """
+    present = {}
+    crawl = None
+    listed = set()
+    for row in rows:
+        if row[FOLDER] == 'folder':
+            crawl = row[FILENAME]
+            paths = crawlPaths(fhs, index[crawl]) if crawl in index else []
+            listed = set(path.split('/')[-1] for path in paths)
+        elif row[FILENAME] in listed:
+            present.setdefault(crawl, set()).add(row[FILENAME])
+    return present
+
+def mergeFiles(index, fhs, present, reader, writer, hasher, digest='md5'):
+    """
+    Merge the missing files into the metadata in one pass, then report the
+    bytes now on each unit.
+    """
+    totals = {}
+    for row in mergeRows(index, fhs, present, reader, hasher, digest, totals, reader.fields):
         writer.writerow(row)
-        if row['folder'] == 'folder':
-            crawl = row['filename']
-            if crawl in files:
-                print "found " + crawl
-                files_to_output = files[crawl]
-                uriBase = IDENTIFIER_BASE + crawl
-                for path in files_to_output:
-                    row['crawl_start'] = ''
-                    row['crawl_end'] = ''
-                    filename = path.split('/')[-1]
-                    parts = splitFilename(filename)
-                    row['filename'] = filename
-                    arcSize = getArcSize(path)
-                    row['filesize'] = arcSize
-                    row['identifier'] = uriBase + '/' + filename
-                    row['folder'] = 'file'
-                    date = dateConvert(parts.group(2))
-                    row['date_created'] = date
-                    row['checksum'] = md5sum(path)
-                    part = parts.group(3)
-                    if part:
-                        row['series_number'] = part
-                    # unit is already populated
-                    writer.writerow(row)
-
-def md5sum(fname):
-    hash_md5 = md5()
-    with open(fname, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
-
-def splitFilename(filename):
-    if filename[:14] == 'TNA-EXTRACTED-':
-        pattern = re.compile('^(.*\-(\d{4}))\-part\-(\d{8}).*$')
-    else:
-        pattern = re.compile('^(.*)[\-P](\d{6,17})[^\d](\d{1,5})?[^\d].*$')
-    parts = re.match(pattern, filename)
-    return parts
+        metrics.count('rows')
+        metrics.progress()
+    metrics.progress(final=True)
+    report(dict((unit, unit) for unit in totals), totals, UNIT_SIZE)
+    for unit in sorted(totals):
+        if totals[unit] >= UNIT_SIZE:
+            print "[WARN] Unit %s is over capacity" % unit
+
+def mergeRows(index, fhs, present, rows, hasher, digest='md5', totals=None, fields=FIELDS):
+    """
+    Pass metadata rows through, merging the rows for the missing files of
+    each folder in among its existing files in (timestamp, part) order.
+    Files present (from presentFiles) are already there, and are left
+    where they are.
+    The folder's crawl_start and crawl_end, on every one of its rows, are
+    widened to cover the new files. An inserted file goes on the unit of
+    the file before it (the file after it, at the start of a folder).
+    Bytes of the file rows are added up per unit in totals. New rows are
+    as wide as fields.
+    """
+    if totals is None:
+        totals = {}
+    found = set()
+    rows = iter(rows)
+    row = next(rows, None)
+    while row is not None:
+        if row[FOLDER] != 'folder' or row[FILENAME] not in index:
+            countRow(totals, row)
+            yield row
+            row = next(rows, None)
+            continue
+        folder = row[:]
+        crawl = folder[FILENAME]
+        found.add(crawl)
+        print "found " + crawl
+        there = present.get(crawl, set())
+        paths = crawlPaths(fhs, index[crawl])
+        hasher.submit(path for path in paths if path.split('/')[-1] not in there)
+        keys = [sortKey(path.split('/')[-1]) for path in paths]
+        dates = [date for date in (folder[CRAWL_START], folder[CRAWL_END]) + crawlDates(keys)
+                 if date]
+        start = min(dates) if dates else ''
+        end = max(dates) if dates else ''
+        folder[CRAWL_START] = start
+        folder[CRAWL_END] = end
+        yield folder
+        row = next(rows, None)
+        unit = None
+        i = 0
+        while True:
+            existing = row if row is not None and row[FOLDER] != 'folder' else None
+            if i < len(paths) and paths[i].split('/')[-1] in there:
+                print "[INFO] %s is already there" % paths[i].split('/')[-1]
+                i += 1
+            elif i < len(paths) and \
+                 (existing is None or keys[i] < sortKey(existing[FILENAME])):
+                if unit is None:
+                    unit = existing[UNIT] if existing else ''
+                inserted = fileRow(crawl, paths[i], keys[i], hasher, digest, fields)
+                inserted[CRAWL_START] = start
+                inserted[CRAWL_END] = end
+                inserted[UNIT] = unit
+                countRow(totals, inserted)
+                yield inserted
+                i += 1
+            elif existing is not None:
+                existing[CRAWL_START] = start
+                existing[CRAWL_END] = end
+                # a duplicate is on no unit, so the file before it sets the unit
+                unit = existing[UNIT] or unit
+                countRow(totals, existing)
+                yield existing
+                row = next(rows, None)
+            else:
+                break
+    for crawl in sorted(set(index) - found):
+        print "[WARN] No folder for %s, its files were not inserted" % crawl
+
+def fileRow(crawl, path, key, hasher, digest='md5', fields=FIELDS):
+    """
+    A new row for a missing file, as wide as fields.
+    """
+    filename = path.split('/')[-1]
+    row = blankRow(fields)
+    row[IDENTIFIER] = IDENTIFIER_BASE + crawl + '/' + filename
+    row[FILENAME] = filename
+    row[FOLDER] = 'file'
+    row[DATE_CREATED] = dateConvert(key[1]) if key[1] else ''
+    row[CHECKSUM] = hasher.digests(path)[digest]
+    if key[2] >= 0:
+        row[SERIES_NUMBER] = parseFilename(filename)[2]
+    row[FILESIZE] = getArcSize(path)
+    return row
+
+def unitFills(index, fhs, rows, hasher):
+    """
+    First pass of a delta: the bytes on each unit once the files no longer
+    listed are dropped and changed files take their new size, before any
+    files are added. The changed and added files are queued for hashing as
+    they are found. Returns the fills and a dict of crawl folder -> the
+    files in the list that the folder has no row for, wherever among its
+    rows they might have been.
+    """
+    fills = {}
+    added = {}
+    found = set()
+    crawl = None
+    listed = {}
+    existing = set()
+    for row in rows:
+        if row[FOLDER] == 'folder':
+            new = set(listed) - existing
+            if new:
+                added[crawl] = new
+                hasher.submit(listed[name] for name in sorted(new))
+            crawl = row[FILENAME]
+            found.add(crawl)
+            paths = crawlPaths(fhs, index[crawl]) if crawl in index else []
+            listed = dict((path.split('/')[-1], path) for path in paths)
+            existing = set()
+            continue
+        path = listed.get(row[FILENAME])
+        if path is None:
+            continue
+        existing.add(row[FILENAME])
+        filesize = getArcSize(path)
+        if str(filesize) != row[FILESIZE]:
+            hasher.submit([path])
+        if row[UNIT] != '':
+            fills[row[UNIT]] = fills.get(row[UNIT], 0) + filesize
+    new = set(listed) - existing
+    if new:
+        added[crawl] = new
+        hasher.submit(listed[name] for name in sorted(new))
+    for crawl in newCrawls(index, found):
+        hasher.submit(crawlPaths(fhs, index[crawl]))
+    return fills, added
+
+def newCrawls(index, found):
+    """
+    The crawls in the list with no folder in the metadata, in list order.
+    """
+    return sorted(set(index) - found, key=lambda crawl: index[crawl][0])
+
+def deltaFiles(index, fhs, fills, added, reader, writer, hasher, digest='md5'):
+    """
+    Write the metadata for a new release in one pass over the previous
+    release, then report the bytes now on each unit.
+    """
+    counts = {'added': 0, 'changed': 0, 'removed': 0}
+    for row in deltaRows(index, fhs, reader, hasher, digest, fills, added, counts,
+                         reader.fields):
+        writer.writerow(row)
+        metrics.count('rows')
+        metrics.progress()
+    metrics.progress(final=True)
+    print "[INFO] Delta : %(added)d added, %(changed)d changed, %(removed)d removed" % counts
+    report(dict((unit, unit) for unit in fills), fills, UNIT_SIZE)
+    for unit in sorted(fills):
+        if fills[unit] >= UNIT_SIZE:
+            print "[WARN] Unit %s is over capacity" % unit
+
+def deltaRows(index, fhs, rows, hasher, digest, fills, added, counts, fields=FIELDS):
+    """
+    Pass the previous release's rows through against the sorted new list:
+    files not in the list are dropped (with their folder, if none of its
+    files is listed), files listed with a new size are given that size and
+    a new checksum, and new files (added, from unitFills) are merged in as
+    by mergeRows. Crawls not
+    in the metadata follow as new folders. Added files go on the unit of
+    the file before them while it has room, and otherwise on the units as
+    groupFiles fills them, carrying on from the last unit in use. New rows
+    are as wide as fields.
+    """
+    units = openUnits(fills)
+    found = set()
+    rows = iter(rows)
+    row = next(rows, None)
+    while row is not None:
+        if row[FOLDER] != 'folder':
+            yield row
+            row = next(rows, None)
+            continue
+        folder = row[:]
+        crawl = folder[FILENAME]
+        found.add(crawl)
+        row = next(rows, None)
+        if crawl not in index:
+            print "[INFO] Removed folder " + crawl
+            while row is not None and row[FOLDER] != 'folder':
+                counts['removed'] += 1
+                row = next(rows, None)
+            continue
+        paths = crawlPaths(fhs, index[crawl])
+        listed = dict((path.split('/')[-1], path) for path in paths)
+        keys = [sortKey(path.split('/')[-1]) for path in paths]
+        # the new list is the whole crawl, so its dates are the list's,
+        # which may have lost the crawl's first or last file
+        start, end = crawlDates(keys)
+        start = start or folder[CRAWL_START]
+        end = end or folder[CRAWL_END]
+        folder[CRAWL_START] = start
+        folder[CRAWL_END] = end
+        yield folder
+        new = added.get(crawl, set())
+        unit = None
+        i = 0
+        while True:
+            existing = row if row is not None and row[FOLDER] != 'folder' else None
+            if i < len(paths) and paths[i].split('/')[-1] not in new:
+                # has a row, in or out of order, which keeps its place
+                i += 1
+            elif existing is not None and existing[FILENAME] not in listed:
+                counts['removed'] += 1
+                row = next(rows, None)
+            elif i < len(paths) and \
+                 (existing is None or keys[i] < sortKey(existing[FILENAME])):
+                if unit is None:
+                    unit = existing[UNIT] if existing else ''
+                inserted = fileRow(crawl, paths[i], keys[i], hasher, digest, fields)
+                inserted[CRAWL_START] = start
+                inserted[CRAWL_END] = end
+                inserted[UNIT] = unit = placeFile(fills, units, inserted[FILESIZE], unit)
+                counts['added'] += 1
+                yield inserted
+                i += 1
+            elif existing is not None:
+                path = listed[existing[FILENAME]]
+                filesize = getArcSize(path)
+                if str(filesize) != existing[FILESIZE]:
+                    existing[FILESIZE] = filesize
+                    existing[CHECKSUM] = hasher.digests(path)[digest]
+                    counts['changed'] += 1
+                existing[CRAWL_START] = start
+                existing[CRAWL_END] = end
+                # a duplicate is on no unit, so the file before it sets the unit
+                unit = existing[UNIT] or unit
+                yield existing
+                row = next(rows, None)
+            else:
+                break
+    for crawl in newCrawls(index, found):
+        paths = crawlPaths(fhs, index[crawl])
+        keys = [sortKey(path.split('/')[-1]) for path in paths]
+        folder = blankRow(fields)
+        folder[IDENTIFIER] = IDENTIFIER_BASE + crawl
+        folder[FILENAME] = crawl
+        folder[FOLDER] = 'folder'
+        folder[CRAWL_START], folder[CRAWL_END] = crawlDates(keys)
+        yield folder
+        unit = ''
+        for path, key in zip(paths, keys):
+            row = fileRow(crawl, path, key, hasher, digest, fields)
+            row[CRAWL_START] = folder[CRAWL_START]
+            row[CRAWL_END] = folder[CRAWL_END]
+            row[UNIT] = unit = placeFile(fills, units, row[FILESIZE], unit)
+            counts['added'] += 1
+            yield row
+
+def openUnits(fills):
+    """
+    The units added files can fill, in order: the last unit in use, and
+    every unit after it.
+    """
+    labels = [str(unit) for unit in UNITS]
+    used = [i for i, label in enumerate(labels) if fills.get(label)]
+    return labels[used[-1] if used else 0:]
+
+def placeFile(fills, units, filesize, preferred=''):
+    """
+    The unit for an added file: the preferred unit if it has room, and
+    otherwise the first of the open units that does, dropping the full
+    ones as groupFiles does. Raises ValueError if no unit has room.
+    """
+    if not (preferred and fills.get(preferred, 0) + filesize < UNIT_SIZE):
+        while units and fills.get(units[0], 0) + filesize >= UNIT_SIZE:
+            units.pop(0)
+        if not units:
+            raise ValueError("no unit has room for another %s" % size(filesize))
+        preferred = units[0]
+    fills[preferred] = fills.get(preferred, 0) + filesize
+    return preferred
+
+def countRow(totals, row):
+    if row[FOLDER] == 'file' and row[UNIT] != '':
+        totals[row[UNIT]] = totals.get(row[UNIT], 0) + long(row[FILESIZE] or 0)
+
+def md5sum(fname, cache=None):
+    """
+    MD5 of a file, taken from the ChecksumCache if it is there and the file
+    is unchanged.
+    """
+    digests = cache.get(fname) if cache else None
+    if digests is None:
+        digests = hashFile(fname)
+        if cache:
+            cache.put(fname, digests)
+    return digests['md5']
 
 def getArcSize(filename):
     statinfo = stat(filename)
     return statinfo.st_size
 
-def getArcSizeRemote(uname, pwd, url):
+def getArcSizeRemote(uname, pwd, url, cache=None):
     """
     find the size of an Arc file by making a HEAD call to the url and parsing
-    the result.
-    """
-    user_agent = {'User-agent': 'processLists'}
-    h = requests.head(url.strip(),headers=user_agent,auth=HTTPBasicAuth(uname, pwd))
-    print "[INFO] HTTP Status : %s" % h.status_code
-    if h.status_code == 302:
-        print "[INFO] HTTP Location : %s" % h.headers['Location']
-        h = requests.head(h.headers['Location'], headers=user_agent, \
-                          auth=HTTPBasicAuth(uname, pwd))
-    # random sleep between 0.1 and 0.7 second (do not stress the server)
-    time.sleep(random.randint(1,7) / 10.0) 
-    if 'content-length' in h.headers:
-        return h.headers['content-length']
-    else:
-        print "[ERROR] HTTP Status : %s" % h.status_code
-        print "[DEBUG] HTTP Header : %s" % h.headers
-        return 0
-
-def dateConvert(date):
-    """
-    Convert multiple date formats to ISO8601 Probably false assumption made
-    that times are UTC.
-    """
-    # print date
-    # just a year
-    if len(date) == 4:
-        date = date
-    elif len(date) == 8:
-        date_object = datetime.strptime(date, '%Y%m%d')
-        date = strftime('%Y-%m-%d', date_object.timetuple())
-    elif len(date) == 12:
-        date_object = datetime.strptime(date, '%y%m%d%H%M%S')
-        date = strftime('%Y-%m-%dT%H:%M:%SZ', date_object.timetuple())
-    elif (len(date) == 14) or (len(date) == 17) :
-        date_object = datetime.strptime(date[:14], '%Y%m%d%H%M%S')
-        date = strftime('%Y-%m-%dT%H:%M:%SZ', date_object.timetuple())
-    else:
-        date = '*' + date # should never happen
-    return date
-        
+    the result, or from the size cache (the default one unless another
+    SizeCache is given) if it holds the url.
+    """
+    if cache is not None:
+        return ArcSizer(uname, pwd, 1, cache=cache).getArcSize(url)
+    cache = SizeCache()
+    try:
+        return ArcSizer(uname, pwd, 1, cache=cache).getArcSize(url)
+    finally:
+        cache.close()
 
 def getParms():
     """
     Get command line parameters.
     """
     filelist = ifile = ofile = uname = pwd = ""
+    opts = {'processes': None, 'digest': 'md5', 'checksums': DEFAULT_CHECKSUMS,
+            'merge': False, 'memory': DEFAULT_MEMORY, 'metrics': '', 'delta': False}
     try:
-        myopts, args = getopt(sys.argv[1:],"u:p:f:i:o:")
+        myopts, args = getopt(sys.argv[1:],"u:p:f:i:o:j:d:c:",
+                              ["merge", "memory=", "metrics=", "delta"])
     except GetoptError as e:
         print (str(e))
         usage()
@@ -176,14 +551,30 @@ def getParms():
             uname = a
         elif o == '-p':
             pwd = a
+        elif o == '-j':
+            opts['processes'] = int(a)
+        elif o == '-d':
+            opts['digest'] = a
+        elif o == '-c':
+            opts['checksums'] = a
+        elif o == '--merge':
+            opts['merge'] = True
+        elif o == '--memory':
+            opts['memory'] = int(a) * 1024 * 1024
+        elif o == '--metrics':
+            opts['metrics'] = a
+        elif o == '--delta':
+            opts['delta'] = True
 
-    if not (uname and pwd and ifile and ofile):
+    if not (uname and pwd and ifile and ofile) or opts['digest'] not in DIGESTS:
         usage()
 
-    return (uname, pwd, filelist, ifile, ofile)
+    return (uname, pwd, filelist, ifile, ofile, opts)
 
 def usage():
-    print("Usage: %s -u username -p password -f filelist -i inputmetadata  -o outputmetadata" % sys.argv[0])
+    print("Usage: %s -u username -p password -f filelist -i inputmetadata  -o outputmetadata" \
+          " [-j processes] [-d md5|sha256] [-c checksumcache]" \
+          " [--merge | --delta [--memory MB]] [--metrics file.json]" % sys.argv[0])
     sys.exit(2)
 
 
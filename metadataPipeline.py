@@ -0,0 +1,122 @@
+#!/usr/bin/python
+"""
+Run the metadata post-processing steps as streaming stages over a single
+read and a single write of the metadata, instead of one full pass (and a
+temporary copy) per script. The folder moves for the folders stage are
+planned, checked and made first, from a quick scan of the folder rows.
+Stages always run in release order:
+  insert  - insert missing files (insertArcMetadata)
+  folders - suffix folders with crawl_start and move them (modifyMetadataFolderNames)
+  notes   - merge in the archivist notes (addArchivistNotes)
+"""
+
+from getopt import getopt, GetoptError
+import sys
+from metadataRow import metadataReader, metadataWriter, NOTE_FIELDS
+from insertArcMetadata import readFileList, insertRows
+from modifyMetadataFolderNames import suffixFolders, renamePlan, checkPlan, runPlan
+from addArchivistNotes import readCorruptList, addNotes
+from arcHasher import ArcHasher, DIGESTS
+from opensslStream import openMetadata
+from checksumCache import ChecksumCache, DEFAULT_CACHE as DEFAULT_CHECKSUMS
+
+STAGES = ['insert', 'folders', 'notes']
+
+def main(argv):
+    stages, mountpoint, ifname, ofname, opts = getParms()
+    checksums = hasher = None
+    try:
+        if 'folders' in stages:
+            with openMetadata(ifname, "rb") as mi:
+                plan = renamePlan(mountpoint, metadataReader(mi))
+            conflicts = checkPlan(plan)
+            for conflict in conflicts:
+                print "[CONFLICT] " + conflict
+            if conflicts:
+                sys.exit(1)
+            runPlan(plan, ofname + '.renames')
+        with openMetadata(ifname, "rb") as mi, openMetadata(ofname, "wb") as mo:
+            reader = rows = metadataReader(mi)
+            if 'insert' in stages:
+                with openMetadata(opts['filelist'], "rb") as fhl:
+                    files, paths = readFileList(fhl)
+                # start hashing every file straight away, in list order
+                checksums = ChecksumCache(opts['checksums'])
+                hasher = ArcHasher(opts['processes'], checksums)
+                hasher.submit(paths)
+                rows = insertRows(files, rows, hasher, opts['digest'])
+            if 'folders' in stages:
+                rows = suffixFolders(mountpoint, rows)
+            if 'notes' in stages:
+                with openMetadata(opts['corrupt'], "rb") as cl:
+                    corrupt = readCorruptList(cl)
+                rows = addNotes(corrupt, rows)
+            writer = metadataWriter(mo, NOTE_FIELDS if 'notes' in stages else reader.fields)
+            print "[INFO] Opened files successfully."
+            for row in rows:
+                writer.writerow(row)
+    except (IOError, OSError) as e:
+        print "[IOERROR] %s" % e
+        sys.exit(1)
+    finally:
+        if hasher:
+            hasher.close()
+            checksums.close()
+
+def getParms():
+    """
+    Get command line parameters.
+    """
+    stages = mountpoint = ifile = ofile = ""
+    opts = {'filelist': '', 'corrupt': '', 'processes': None, 'digest': 'md5',
+            'checksums': DEFAULT_CHECKSUMS}
+    try:
+        myopts, args = getopt(sys.argv[1:],"s:m:i:o:f:n:j:d:c:")
+    except GetoptError as e:
+        print (str(e))
+        usage()
+
+    for o, a in myopts:
+        if o == '-s':
+            stages = a
+        elif o == '-m':
+            mountpoint = a
+        elif o == '-i':
+            ifile = a
+        elif o == '-o':
+            ofile = a
+        elif o == '-f':
+            opts['filelist'] = a
+        elif o == '-n':
+            opts['corrupt'] = a
+        elif o == '-j':
+            opts['processes'] = int(a)
+        elif o == '-d':
+            opts['digest'] = a
+        elif o == '-c':
+            opts['checksums'] = a
+
+    stages = stages.split(',')
+    if mountpoint and not mountpoint.endswith('/'):
+        mountpoint = mountpoint + '/'
+    if mountpoint and not ifile:
+        ifile = mountpoint + 'RW_32/metadata_v7.csv'
+    if not (ifile and ofile) or [s for s in stages if s not in STAGES] \
+       or ('insert' in stages and not opts['filelist']) \
+       or ('folders' in stages and not mountpoint) \
+       or ('notes' in stages and not opts['corrupt']) \
+       or opts['digest'] not in DIGESTS:
+        usage()
+
+    return (stages, mountpoint, ifile, ofile, opts)
+
+def usage():
+    print("Usage: %s -s stage[,stage...] -o outputmetadata [-i inputmetadata]" \
+          " [-m mountpoint] [-f filelist] [-n corrupt_list]" \
+          " [-j processes] [-d md5|sha256] [-c checksumcache]" % sys.argv[0])
+    print("Stages (run in this order): %s" % ', '.join(STAGES))
+    sys.exit(2)
+
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
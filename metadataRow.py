@@ -0,0 +1,71 @@
+"""
+The metadata CSV layout shared by all the scripts. Rows are plain lists in
+field order, indexed by the column constants below, and are read and
+written with the positional csv reader and writer; this avoids building
+a dict of 11-13 keys for every row of a multi-million row file.
+"""
+
+import csv
+
+FIELDS = ['identifier','filename','folder','date_created','checksum', \
+          'series_number','creating_body','crawl_start', 'crawl_end', \
+          'filesize', 'unit']
+NOTE_FIELDS = FIELDS + ['date_archivist_note', 'archivist_note']
+
+# column positions
+(IDENTIFIER, FILENAME, FOLDER, DATE_CREATED, CHECKSUM, SERIES_NUMBER,
+ CREATING_BODY, CRAWL_START, CRAWL_END, FILESIZE, UNIT,
+ DATE_ARCHIVIST_NOTE, ARCHIVIST_NOTE) = range(len(NOTE_FIELDS))
+
+BLANK_ROW = ['', '', '', '', '', '', 'IMF', '', '', '', '']
+# archivist note starting a file flagged as a copy of another (dedupeArcs)
+DUPLICATE_NOTE = 'Duplicate of '
+
+def blankRow(fields=FIELDS):
+    """
+    A new row with every field empty except creating_body, as wide as
+    fields (the header of the file it is to go in).
+    """
+    return BLANK_ROW + [''] * (len(fields) - len(BLANK_ROW))
+
+def isDuplicate(row):
+    """
+    Whether a row is for a file flagged as a duplicate, which is stored on
+    no unit.
+    """
+    return len(row) > ARCHIVIST_NOTE and row[ARCHIVIST_NOTE].startswith(DUPLICATE_NOTE)
+
+class MetadataReader(object):
+    """
+    Positional reader over a metadata file. The header row is read into
+    fields (FIELDS, for an empty file), so that whatever is written out
+    again can have the same columns; iterating gives the rows after it.
+    """
+
+    def __init__(self, fh):
+        self.reader = csv.reader(fh)
+        self.fields = next(self.reader, None) or FIELDS
+
+    def __iter__(self):
+        # the csv reader itself, so rows are read at full speed
+        return self.reader
+
+    def next(self):
+        return next(self.reader)
+
+def metadataReader(fh):
+    """
+    Positional reader over a metadata file, with the header row skipped
+    (and kept in its fields).
+    """
+    return MetadataReader(fh)
+
+def metadataWriter(fh, fields=FIELDS, header=True):
+    """
+    Positional writer for a metadata file, writing the header row first
+    unless told not to (when appending to an existing file).
+    """
+    writer = csv.writer(fh, delimiter=',')
+    if header:
+        writer.writerow(fields)
+    return writer
@@ -0,0 +1,200 @@
+#!/usr/bin/python
+"""
+Indexed store of a metadata file, so lookups by filename, crawl folder,
+unit or checksum do not each need a full scan of the CSV. The store is
+imported from a metadata file and can be exported back to exactly the
+same CSV. Run as a script to import, export or query a store.
+"""
+
+from getopt import getopt, GetoptError
+import sys, sqlite3
+from hurry.filesize import size
+from opensslStream import openMetadata
+from metadataRow import metadataReader, metadataWriter, FIELDS, NOTE_FIELDS, \
+     FILENAME, FOLDER
+
+DEFAULT_STORE = 'metadata.db'
+INSERT_BATCH = 10000    # rows per executemany
+
+class MetadataStore(object):
+    """
+    SQLite table of metadata rows in file order, with the crawl folder each
+    row belongs to, indexed on filename, crawl, unit and checksum. Every
+    field is kept as the text read from the CSV, so an export writes the
+    same bytes back.
+    """
+
+    def __init__(self, path=DEFAULT_STORE):
+        self.db = sqlite3.connect(path)
+        # bytes in and out, as the csv module reads and writes them
+        self.db.text_factory = str
+        self.db.execute('CREATE TABLE IF NOT EXISTS metadata ('
+                        'seq INTEGER PRIMARY KEY, crawl TEXT, %s)'
+                        % ', '.join('%s TEXT' % name for name in NOTE_FIELDS))
+        self.db.execute('CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)')
+        for column in ('filename', 'crawl', 'unit', 'checksum'):
+            self.db.execute('CREATE INDEX IF NOT EXISTS metadata_%s ON metadata (%s)'
+                            % (column, column))
+
+    def load(self, rows):
+        """
+        Replace the contents of the store with the given metadata rows.
+        Returns the number of rows imported.
+        """
+        self.db.execute('DELETE FROM metadata')
+        width = len(FIELDS)
+        count = 0
+        crawl = None
+        batch = []
+        insert = 'INSERT INTO metadata VALUES (?, ?, %s)' % ', '.join('?' * len(NOTE_FIELDS))
+        for row in rows:
+            if row[FOLDER] == 'folder':
+                crawl = row[FILENAME]
+            width = max(width, len(row))
+            batch.append([count, crawl] + row + [''] * (len(NOTE_FIELDS) - len(row)))
+            count += 1
+            if len(batch) >= INSERT_BATCH:
+                self.db.executemany(insert, batch)
+                batch = []
+        self.db.executemany(insert, batch)
+        self.db.execute('INSERT OR REPLACE INTO info VALUES (?, ?)', ('width', str(width)))
+        self.db.commit()
+        return count
+
+    def fields(self):
+        """
+        The header of the imported file: FIELDS, or NOTE_FIELDS if it had
+        archivist notes.
+        """
+        row = self.db.execute("SELECT value FROM info WHERE key = 'width'").fetchone()
+        return NOTE_FIELDS[:int(row[0])] if row else FIELDS
+
+    def select(self, where='', args=()):
+        """
+        Rows matching an SQL condition, in file order, as lists the width
+        of the imported file.
+        """
+        width = len(self.fields())
+        query = 'SELECT %s FROM metadata %s ORDER BY seq' % (', '.join(NOTE_FIELDS), \
+                'WHERE ' + where if where else '')
+        for row in self.db.execute(query, args):
+            yield list(row[:width])
+
+    def rows(self):
+        return self.select()
+
+    def find(self, filename):
+        return list(self.select('filename = ?', (filename,)))
+
+    def crawlRows(self, crawl):
+        """
+        The folder row and file rows of a crawl folder.
+        """
+        return list(self.select('crawl = ?', (crawl,)))
+
+    def withChecksum(self, checksum):
+        return list(self.select("checksum = ? AND folder = 'file'", (checksum,)))
+
+    def unitTotals(self):
+        """
+        (unit, files, bytes) for each unit, in unit order.
+        """
+        return self.db.execute("SELECT unit, COUNT(*), SUM(CAST(filesize AS INTEGER)) "
+                               "FROM metadata WHERE folder = 'file' GROUP BY unit "
+                               "ORDER BY CAST(unit AS INTEGER)").fetchall()
+
+    def rowsWithNotes(self, corrupt):
+        """
+        Every row with the archivist note date and text added, joined from
+        a dict of filename -> [date, note] for the file rows it names, and
+        empty otherwise (or the notes the row already had); as
+        addArchivistNotes.addNotes does.
+        """
+        self.db.execute('CREATE TEMP TABLE IF NOT EXISTS notes '
+                        '(filename TEXT PRIMARY KEY, date TEXT, note TEXT)')
+        self.db.execute('DELETE FROM notes')
+        self.db.executemany('INSERT INTO notes VALUES (?, ?, ?)',
+                            [[filename] + note for filename, note in corrupt.items()])
+        query = "SELECT %s, CASE WHEN folder = 'file' AND notes.date IS NOT NULL " \
+                "THEN notes.date ELSE date_archivist_note END, " \
+                "CASE WHEN folder != 'file' OR notes.note IS NULL THEN archivist_note " \
+                "WHEN archivist_note = '' THEN notes.note " \
+                "ELSE archivist_note || '; ' || notes.note END " \
+                "FROM metadata LEFT JOIN notes USING (filename) ORDER BY seq" \
+                % ', '.join('metadata.' + name for name in FIELDS)
+        for row in self.db.execute(query):
+            yield list(row)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+def main(argv):
+    storename, action, arg = getParms()
+    store = MetadataStore(storename)
+    try:
+        if action == 'import':
+            with openMetadata(arg, "rb") as fhi:
+                print "[INFO] Imported %d rows" % store.load(metadataReader(fhi))
+        elif action == 'export':
+            with openMetadata(arg, "wb") as fho:
+                writer = metadataWriter(fho, store.fields())
+                for row in store.rows():
+                    writer.writerow(row)
+        elif action == 'units':
+            for unit, files, total in store.unitTotals():
+                print "[INFO] Unit %s : %d files, %s" % (unit, files, size(total or 0))
+        else:
+            rows = {'find': store.find, 'crawl': store.crawlRows,
+                    'checksum': store.withChecksum}[action](arg)
+            writer = metadataWriter(sys.stdout, store.fields(), header=bool(rows))
+            for row in rows:
+                writer.writerow(row)
+    except IOError as e:
+        print "[IOERROR] %s" % e
+        sys.exit(1)
+    finally:
+        store.close()
+
+def getParms():
+    """
+    Get command line parameters.
+    """
+    storename = DEFAULT_STORE
+    actions = []
+    try:
+        myopts, args = getopt(sys.argv[1:],"s:f:k:C:",
+                              ["import=", "export=", "units"])
+    except GetoptError as e:
+        print (str(e))
+        usage()
+
+    for o, a in myopts:
+        if o == '-s':
+            storename = a
+        elif o == '--import':
+            actions.append(('import', a))
+        elif o == '--export':
+            actions.append(('export', a))
+        elif o == '--units':
+            actions.append(('units', None))
+        elif o == '-f':
+            actions.append(('find', a))
+        elif o == '-k':
+            actions.append(('checksum', a))
+        elif o == '-C':
+            actions.append(('crawl', a))
+
+    if len(actions) != 1:
+        usage()
+
+    return (storename,) + actions[0]
+
+def usage():
+    print("Usage: %s [-s store] --import metadata | --export metadata | --units" \
+          " | -f filename | -k checksum | -C crawl" % sys.argv[0])
+    sys.exit(2)
+
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
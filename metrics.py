@@ -0,0 +1,141 @@
+"""
+Counters and histograms of the scripts' throughput (HEAD requests and
+their latency, redirects, bytes hashed, rows written, units filled), a
+progress line printed at most every PROGRESS_INTERVAL seconds in place of
+a line per file, and an optional JSON dump of it all at exit. There is
+one set of metrics per process, shared by every module that imports this
+one.
+"""
+
+import time, threading, json, math, atexit
+
+PROGRESS_INTERVAL = 10  # seconds between progress lines
+
+class Histogram(object):
+    """
+    Count, total, min and max of the values observed, and counts in
+    power-of-two buckets, from which rough percentiles are taken.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.buckets = {}
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        bucket = int(math.ceil(math.log(value, 2))) if value > 0 else None
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, fraction):
+        """
+        Upper bound of the bucket holding the given fraction of values.
+        """
+        seen = 0
+        for bucket in sorted(self.buckets, key=lambda b: -1e9 if b is None else b):
+            seen += self.buckets[bucket]
+            if seen >= fraction * self.count:
+                return 0 if bucket is None else min(2.0 ** bucket, self.max)
+        return self.max
+
+    def summary(self):
+        return {'count': self.count, 'sum': self.total, 'min': self.min, 'max': self.max,
+                'mean': self.total / float(self.count) if self.count else None,
+                'p50': self.percentile(0.5), 'p95': self.percentile(0.95),
+                'p99': self.percentile(0.99),
+                'buckets': dict(('<=2^%s' % b if b is not None else '<=0', n)
+                                for b, n in self.buckets.items())}
+
+class Metrics(object):
+    """
+    Named counters and histograms, safe to update from any thread.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.lastProgress = self.started
+        self.total = None
+        self.firstDone = None
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, value):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].add(value)
+
+    def setTotal(self, total):
+        """
+        The amount of work (say bytes of input) that progress is given
+        against, for the percentage done and the ETA.
+        """
+        self.total = total
+
+    def progress(self, done=None, final=False):
+        """
+        Print a progress line, if PROGRESS_INTERVAL seconds have passed
+        since the last one (or this is the final one): rows, HEAD requests
+        and bytes hashed per second and, if the total is known, the
+        percentage done and an ETA.
+        """
+        now = time.time()
+        if self.firstDone is None and done is not None:
+            self.firstDone = done
+        if not final and now - self.lastProgress < PROGRESS_INTERVAL:
+            return
+        self.lastProgress = now
+        elapsed = max(now - self.started, 1e-6)
+        with self.lock:
+            counters = dict(self.counters)
+        parts = ['%d rows' % counters.get('rows', 0),
+                 '%.0f rows/s' % (counters.get('rows', 0) / elapsed)]
+        if counters.get('head.requests'):
+            parts.append('%.1f HEAD/s' % (counters['head.requests'] / elapsed))
+        if counters.get('hash.bytes'):
+            parts.append('%.1f MB/s hashed' % (counters['hash.bytes'] / elapsed / 1048576))
+        line = ', '.join(parts)
+        if self.total and done is not None:
+            line = '%.1f%% (%s' % (100.0 * done / self.total, line)
+            rate = (done - self.firstDone) / elapsed
+            if rate > 0 and not final:
+                line += ', ETA %s' % formatSeconds((self.total - done) / rate)
+            line += ')'
+        print "[INFO] Progress : %s" % line
+
+    def summary(self):
+        with self.lock:
+            return {'elapsed': time.time() - self.started,
+                    'counters': dict(self.counters),
+                    'histograms': dict((name, h.summary())
+                                       for name, h in self.histograms.items())}
+
+    def dump(self, fname):
+        with open(fname, "w") as fh:
+            json.dump(self.summary(), fh, indent=1, sort_keys=True)
+
+def formatSeconds(seconds):
+    seconds = int(seconds)
+    return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+registry = Metrics()
+count = registry.count
+observe = registry.observe
+setTotal = registry.setTotal
+progress = registry.progress
+
+def dumpAtExit(fname):
+    """
+    Write the metrics to fname as JSON when the script exits.
+    """
+    atexit.register(registry.dump, fname)
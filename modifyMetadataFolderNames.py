@@ -2,73 +2,221 @@
 """
 Add the crawl start date to each folder in the metadata, and move the
 actual folder correspondingly
+The full list of moves is planned from the metadata and checked before
+anything is touched; the moves are then made in parallel, with a journal
+so that an interrupted run can be resumed or rolled back, and the new
+metadata is only written once every folder has moved.
 """
 
 from getopt import getopt, GetoptError
-from csv import DictWriter, DictReader
-import sys, re, requests, time, random
+import sys, os, errno, threading
 from datetime import datetime
 from time import strftime
 from hurry.filesize import size
-from os import stat
 from shutil import move
+from multiprocessing.pool import ThreadPool
+from opensslStream import openMetadata
+from metadataRow import metadataReader, metadataWriter, isDuplicate, IDENTIFIER, \
+     FILENAME, FOLDER, CRAWL_START, ARCHIVIST_NOTE, DUPLICATE_NOTE
 
 
 IDENTIFIER_BASE = 'file:///T:WORK/RW_32/content/'
+DEFAULT_WORKERS = 8     # moves in flight at once
 
 def main(argv):
-    mountpoint, ofname = getParms()
+    mountpoint, ofname, opts = getParms()
     if not mountpoint.endswith('/'):
         mountpoint = mountpoint  + '/'
     ifname = mountpoint + 'RW_32/metadata_v7.csv'
+    journal = ofname + '.renames'
+    if opts['rollback']:
+        print "[INFO] Rolled back %d moves" % rollback(journal)
+        return
     # try opening the files    
     try:
+        with openMetadata(ifname, "rb") as mi:
+            plan = renamePlan(mountpoint, metadataReader(mi))
+        done = loadJournal(journal) if opts['resume'] else set()
+        conflicts = checkPlan(plan, done)
+        for conflict in conflicts:
+            print "[CONFLICT] " + conflict
+        print "[INFO] %d folders to move, %d already moved, %d conflicts" % \
+              (len(plan) - len(done), len(done), len(conflicts))
+        if conflicts or opts['dryrun']:
+            sys.exit(1 if conflicts else 0)
+        runPlan(plan, journal, done, opts['workers'])
         #scl enable python27 bash
         # to allow multiple openings on one line
-        with open(ifname, "rb") as mi, open(ofname, "wb") as mo:
-            fields = ['identifier','filename','folder','date_created','checksum', \
-                      'series_number','creating_body','crawl_start', 'crawl_end', \
-                      'filesize', 'unit']
-            reader = DictReader(mi, fieldnames=fields)
-            writer = DictWriter(mo, delimiter=',', fieldnames=fields)
-            writer.writerow(dict((fn,fn) for fn in fields))
+        with openMetadata(ifname, "rb") as mi, openMetadata(ofname, "wb") as mo:
+            reader = metadataReader(mi)
+            writer = metadataWriter(mo, reader.fields)
             print "[INFO] Opened files successfully."
             modifyMetadata(mountpoint, reader, writer)
-    except IOError as e:
-        print "[IOERROR] " + e
+    except (IOError, OSError) as e:
+        print "[IOERROR] %s" % e
+        sys.exit(1)
+
+def renamePlan(mountpoint, rows):
+    """
+    The (old, new) path of every folder to move, in metadata order. A folder
+    listed more than once with the same new name is only moved once.
+    """
+    plan = []
+    seen = set()
+    for row in rows:
+        if row[FOLDER] == 'folder':
+            start_date = row[CRAWL_START].split("T")[0]
+            old_identifier = row[IDENTIFIER].replace('file:///T:WORK/', mountpoint)
+            new_identifier = old_identifier + '_' + start_date
+            if (old_identifier, new_identifier) not in seen:
+                seen.add((old_identifier, new_identifier))
+                plan.append((old_identifier, new_identifier))
+    return plan
+
+def checkPlan(plan, done=()):
+    """
+    Describe everything that would stop the plan going through cleanly:
+    missing folders, folders moved to two places, and new names that are
+    taken, on disk or twice in the plan. Moves already done are skipped.
+    """
+    conflicts = []
+    sources = {}
+    targets = {}
+    for old, new in plan:
+        if old in sources:
+            conflicts.append("%s would move to both %s and %s" % (old, sources[old], new))
+        if new in targets:
+            conflicts.append("%s and %s would both move to %s" % (targets[new], old, new))
+        sources[old] = new
+        targets[new] = old
+        if (old, new) in done:
+            continue
+        if not os.path.isdir(old):
+            conflicts.append("%s does not exist" % old)
+        if os.path.exists(new):
+            conflicts.append("%s already exists" % new)
+    return conflicts
+
+def moveFolder(old, new):
+    """
+    Rename a folder, falling back to a copying move across filesystems.
+    """
+    try:
+        os.rename(old, new)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        move(old, new)
+
+def runPlan(plan, journal, done=(), workers=DEFAULT_WORKERS):
+    """
+    Make the planned moves in parallel. Each move is written to the journal
+    before it is started ('B') and after it has finished ('D'). The journal
+    is started afresh unless some moves are already done.
+    """
+    lock = threading.Lock()
+    with open(journal, "ab" if done else "wb") as fhj:
+        def record(state, old, new):
+            with lock:
+                fhj.write('%s\t%s\t%s\n' % (state, old, new))
+                fhj.flush()
+                os.fsync(fhj.fileno())
+
+        def run(step):
+            old, new = step
+            record('B', old, new)
+            print old + ' -> ' + new
+            moveFolder(old, new)
+            record('D', old, new)
+
+        pool = ThreadPool(workers)
+        try:
+            pool.map(run, [step for step in plan if step not in done])
+        finally:
+            pool.close()
+            pool.join()
+
+def loadJournal(journal):
+    """
+    The moves a journal shows as done. A move that was started but not
+    recorded as finished counts as done if the folder is at its new name
+    and not its old one.
+    """
+    done = set()
+    begun = set()
+    try:
+        with open(journal, "rb") as fhj:
+            for line in fhj:
+                if not line.endswith('\n'):
+                    continue
+                state, old, new = line.rstrip('\n').split('\t')
+                if state == 'B':
+                    begun.add((old, new))
+                elif state == 'D':
+                    done.add((old, new))
+    except IOError:
+        pass
+    for old, new in begun - done:
+        if os.path.isdir(new) and not os.path.exists(old):
+            done.add((old, new))
+    return done
+
+def rollback(journal):
+    """
+    Move every folder the journal shows as moved back to its old name,
+    then remove the journal. Returns the number of folders moved back.
+    """
+    done = loadJournal(journal)
+    for old, new in done:
+        print new + ' -> ' + old
+        moveFolder(new, old)
+    if os.path.exists(journal):
+        os.remove(journal)
+    return len(done)
 
 def modifyMetadata(mountpoint, reader, writer):
+    for row in suffixFolders(mountpoint, reader):
+        writer.writerow(row)
 
+def suffixFolders(mountpoint, rows):
+    """
+    Suffix each folder name, and the folder part of each file identifier,
+    with the crawl start date. The folders themselves are moved beforehand,
+    by runPlan. A duplicate's note is changed to the new identifier of the
+    file it copies, which is always in an earlier folder.
+    """
     # default start_date
     start_date = ''
-    # skip header row
-    next(reader, None)
-    for row in reader:
-        if row['folder'] == 'folder':
-            start_date = row['crawl_start'].split("T")[0]
-            old_identifier = row['identifier']
-            row['identifier'] = row['identifier'] + '_' + start_date
-            row['filename'] = row['filename'] + '_' + start_date
-            old_identifier = old_identifier.replace('file:///T:WORK/', mountpoint)
-            new_identifier = row['identifier']
-            new_identifier = new_identifier.replace('file:///T:WORK/', mountpoint)
-            print old_identifier + ' -> ' + new_identifier
-            move(old_identifier, new_identifier)
-            writer.writerow(row)
+    # old folder identifier -> new
+    renamed = {}
+    for row in rows:
+        if row[FOLDER] == 'folder':
+            start_date = row[CRAWL_START].split("T")[0]
+            renamed[row[IDENTIFIER]] = row[IDENTIFIER] + '_' + start_date
+            row[IDENTIFIER] = row[IDENTIFIER] + '_' + start_date
+            row[FILENAME] = row[FILENAME] + '_' + start_date
+            yield row
         else:
-            identifier = row['identifier']
-            bits = row['identifier'].split('/')
+            identifier = row[IDENTIFIER]
+            bits = row[IDENTIFIER].split('/')
             bits[len(bits)-2] += '_' + start_date
-            row['identifier'] = "/".join(bits)
-            writer.writerow(row)
+            row[IDENTIFIER] = "/".join(bits)
+            if isDuplicate(row):
+                first, sep, rest = row[ARCHIVIST_NOTE][len(DUPLICATE_NOTE):].partition('; ')
+                folder, name = first.rsplit('/', 1)
+                if folder in renamed:
+                    row[ARCHIVIST_NOTE] = DUPLICATE_NOTE + renamed[folder] + '/' + name + sep + rest
+            yield row
             
 def getParms():
     """
     Get command line parameters.
     """
     mountpoint = ofile = ""
+    opts = {'workers': DEFAULT_WORKERS, 'dryrun': False, 'resume': False,
+            'rollback': False}
     try:
-        myopts, args = getopt(sys.argv[1:],"m:o:")
+        myopts, args = getopt(sys.argv[1:],"m:o:j:nr", ["rollback"])
     except GetoptError as e:
         print (str(e))
         usage()
@@ -78,14 +226,23 @@ def getParms():
             mountpoint = a
         elif o == '-o':
             ofile = a
+        elif o == '-j':
+            opts['workers'] = int(a)
+        elif o == '-n':
+            opts['dryrun'] = True
+        elif o == '-r':
+            opts['resume'] = True
+        elif o == '--rollback':
+            opts['rollback'] = True
 
     if not (mountpoint and ofile):
         usage()
 
-    return (mountpoint, ofile)
+    return (mountpoint, ofile, opts)
 
 def usage():
-    print("Usage: %s -m mountpoint -o outputmetadata" % sys.argv[0])
+    print("Usage: %s -m mountpoint -o outputmetadata [-j workers] [-n (dry run)]" \
+          " [-r (resume)] [--rollback]" % sys.argv[0])
     sys.exit(2)
 
 
@@ -0,0 +1,212 @@
+"""
+Read and write files in the openssl "Salted__" AES-256-CBC format on the
+fly, so encrypted file lists and metadata (*.enc) never need decrypting
+to disk. Compatible with
+
+  openssl enc -aes-256-cbc -e / openssl aes-256-cbc -d
+
+using the passphrase in $METADATA_PASSWORD (asked for if unset) and the
+key digest in $METADATA_MD (md5, the old openssl default, unless set;
+openssl 1.1.0 and later default to -md sha256).
+"""
+
+import os, hashlib, getpass
+try:
+    from Crypto.Cipher import AES
+except ImportError:
+    # only needed for .enc files
+    AES = None
+
+MAGIC = b'Salted__'
+CHUNK_SIZE = 1024 * 1024    # bytes decrypted or encrypted at a time
+BLOCK = 16                  # AES block size
+
+passphrases = []
+
+def getPassphrase():
+    """
+    The passphrase for encrypted files, asked for at most once.
+    """
+    if not passphrases:
+        passphrases.append(os.environ.get('METADATA_PASSWORD') or
+                           getpass.getpass('Passphrase for encrypted files: '))
+    return passphrases[0]
+
+def deriveKey(passphrase, salt, digest):
+    """
+    openssl's EVP_BytesToKey: a 32 byte key and 16 byte iv from repeated
+    hashing of the passphrase and salt.
+    """
+    derived = block = b''
+    while len(derived) < 48:
+        block = hashlib.new(digest, block + passphrase + salt).digest()
+        derived += block
+    return derived[:32], derived[32:48]
+
+def isEncrypted(fname):
+    return fname.endswith('.enc')
+
+def openMetadata(fname, mode="rb"):
+    """
+    Open a file for reading ("rb") or writing ("wb"), decrypting or
+    encrypting it on the fly if its name ends in .enc.
+    """
+    if not isEncrypted(fname):
+        return open(fname, mode)
+    if AES is None:
+        raise IOError("pycryptodome (or pycrypto) is needed to open %s" % fname)
+    digest = os.environ.get('METADATA_MD', 'md5')
+    passphrase = getPassphrase()
+    if not isinstance(passphrase, bytes):
+        passphrase = passphrase.encode('utf-8')
+    if mode == "rb":
+        return EncryptedReader(open(fname, "rb"), passphrase, digest)
+    elif mode == "wb":
+        return EncryptedWriter(open(fname, "wb"), passphrase, digest)
+    raise ValueError("encrypted files can only be opened with rb or wb, not %s" % mode)
+
+class EncryptedReader(object):
+    """
+    Decrypt a file a chunk at a time, for reading or iterating over lines.
+    The last block is held back until the end of the file, so that the
+    padding can be removed.
+    """
+
+    def __init__(self, fh, passphrase, digest='md5'):
+        self.fh = fh
+        self.passphrase = passphrase
+        self.digest = digest
+        self.start()
+
+    def start(self):
+        header = self.fh.read(16)
+        if header[:8] != MAGIC:
+            raise IOError("%s is not an openssl encrypted file" % self.fh.name)
+        key, iv = deriveKey(self.passphrase, header[8:16], self.digest)
+        self.cipher = AES.new(key, AES.MODE_CBC, iv)
+        self.held = b''     # ciphertext not yet decrypted
+        self.buffer = b''   # plaintext not yet returned
+        self.done = False
+
+    def fill(self):
+        """
+        Decrypt the next chunk into the buffer; False at the end of the file.
+        """
+        if self.done:
+            return False
+        data = self.held + self.fh.read(CHUNK_SIZE)
+        if len(data) <= BLOCK:
+            if len(data) != BLOCK:
+                raise IOError("%s is truncated" % self.fh.name)
+            plain = self.cipher.decrypt(data)
+            pad = ord(plain[-1:])
+            if not 1 <= pad <= BLOCK or plain[-pad:] != plain[-1:] * pad:
+                raise IOError("bad decrypt of %s (wrong passphrase or -md?)" % self.fh.name)
+            self.buffer += plain[:-pad]
+            self.done = True
+            return True
+        # keep back at least the last block, which carries the padding
+        cut = (len(data) - 1) // BLOCK * BLOCK
+        self.buffer += self.cipher.decrypt(data[:cut])
+        self.held = data[cut:]
+        return True
+
+    def read(self, size=-1):
+        while (size < 0 or len(self.buffer) < size) and self.fill():
+            pass
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self):
+        while b'\n' not in self.buffer and self.fill():
+            pass
+        end = self.buffer.find(b'\n') + 1 or len(self.buffer)
+        line, self.buffer = self.buffer[:end], self.buffer[end:]
+        return line
+
+    def __iter__(self):
+        while True:
+            more = self.fill()
+            lines = self.buffer.split(b'\n')
+            # the last piece is an incomplete line
+            self.buffer = lines.pop()
+            for line in lines:
+                yield line + b'\n'
+            if not more:
+                if self.buffer:
+                    line, self.buffer = self.buffer, b''
+                    yield line
+                return
+
+    def seek(self, offset):
+        """
+        Only rewinding is possible.
+        """
+        if offset != 0:
+            raise IOError("can only seek to the start of an encrypted file")
+        self.fh.seek(0)
+        self.start()
+
+    def close(self):
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class EncryptedWriter(object):
+    """
+    Encrypt data as it is written, whole blocks at a time, padding the last
+    block when the file is closed.
+    """
+
+    def __init__(self, fh, passphrase, digest='md5'):
+        self.fh = fh
+        salt = os.urandom(8)
+        key, iv = deriveKey(passphrase, salt, digest)
+        self.cipher = AES.new(key, AES.MODE_CBC, iv)
+        self.fh.write(MAGIC + salt)
+        self.pending = []   # plaintext not yet encrypted
+        self.pendingSize = 0
+        self.written = 0
+
+    def write(self, data):
+        self.pending.append(data)
+        self.pendingSize += len(data)
+        self.written += len(data)
+        if self.pendingSize >= CHUNK_SIZE:
+            data = b''.join(self.pending)
+            cut = len(data) // BLOCK * BLOCK
+            self.fh.write(self.cipher.encrypt(data[:cut]))
+            self.pending = [data[cut:]]
+            self.pendingSize = len(data) - cut
+
+    def tell(self):
+        """
+        Plaintext bytes written so far.
+        """
+        return self.written
+
+    def flush(self):
+        self.fh.flush()
+
+    def fileno(self):
+        return self.fh.fileno()
+
+    def close(self):
+        if self.fh.closed:
+            return
+        pad = BLOCK - self.pendingSize % BLOCK
+        data = b''.join(self.pending) + chr(pad).encode('latin-1') * pad
+        self.fh.write(self.cipher.encrypt(data))
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -2,57 +2,269 @@
 """
 Processes a list of arc file names to generate a CSV file of
 metadata for each file
-Assumes the file list groups crawls together in date ascending order
+Assumes the file list groups crawls together in date ascending order,
+unless --sort is given to sort it first.
 """
 
 from getopt import getopt, GetoptError
-from csv import DictWriter
-import sys, re, requests, time, random
-from datetime import datetime
-from time import strftime
-from requests.auth import HTTPBasicAuth
+import os
+import sys
+import csv, tempfile, shutil
+from multiprocessing import Pool
 from hurry.filesize import size
+from requests import RequestException
+from arcSizer import ArcSizer, DEFAULT_WORKERS, MAX_WAIT
+from sizeCache import SizeCache, DEFAULT_CACHE, DEFAULT_MAX_AGE
+from sizeManifest import SizeManifest
+from checkpoint import Checkpoint, loadCheckpoint
+from unitAllocator import allocateUnits, fillUnits
+from arcNames import parseFilename, listKey, dateConvert
+from externalSort import externalSort, DEFAULT_MEMORY
+from opensslStream import openMetadata, isEncrypted
+import metrics
+from metadataRow import metadataReader, metadataWriter, blankRow, IDENTIFIER, FILENAME, FOLDER, \
+     DATE_CREATED, CHECKSUM, SERIES_NUMBER, CRAWL_START, CRAWL_END, FILESIZE, UNIT
 
 UNIT_SIZE = 1900000000000 # 1.9 TB (actual is 1,953,378,644,000). Needs python >= 2.5
 IDENTIFIER_BASE = 'file:///T:WORK/RW_32/content/'
+# list of available drives by label
+UNITS = range(246,256)
+SPILL_ROWS = 10000  # rows of a crawl folder held in memory before spilling to disk
+COPY_BUFFER = 1024 * 1024   # bytes copied at a time when joining shards
+# state the shard workers inherit when they are forked, rather than have pickled
+shared = {}
 
 def main(argv):
-    uname, pwd, ifname, ofname = getParms()
-    # try opening the files    
+    uname, pwd, ifname, ofname, opts = getParms()
+    if opts['resume'] and (isEncrypted(ifname) or isEncrypted(ofname)):
+        print "[ERROR] Can't resume with an encrypted input or output file"
+        sys.exit(2)
+    if opts['resume'] and opts['shards'] > 1:
+        print "[ERROR] Can't resume a run in shards"
+        sys.exit(2)
+    # when packing or sharding, rows are spooled without units, then allocated in a second phase
+    spooled = opts['pack'] or opts['shards'] > 1
+    spoolname = ofname
+    if spooled:
+        spoolname = ofname[:-4] + '.spool.enc' if isEncrypted(ofname) else ofname + '.spool'
+    journal = spoolname + '.journal'
+    state = loadCheckpoint(journal) if opts['resume'] else None
+    if opts['metrics']:
+        metrics.dumpAtExit(opts['metrics'])
+    manifest = None
+    if opts['manifests']:
+        try:
+            manifest = SizeManifest(opts['manifests'])
+        except IOError as e:
+            print "[ERROR] Can't read size manifest : %s" % e
+            sys.exit(1)
+    sortedname = None
+    if opts['sort']:
+        # the sorted list is kept until the end, so a resumed run reads the same input
+        sortedname = ofname[:-4] + '.sorted.enc' if isEncrypted(ofname) else ofname + '.sorted'
+        if isEncrypted(ifname) and not isEncrypted(sortedname):
+            sortedname += '.enc'
+        if not (state and os.path.exists(sortedname)):
+            try:
+                sortList(ifname, sortedname, opts['memory'])
+            except IOError as e:
+                print "[ERROR] Can't sort '%s' : %s" % (ifname, e)
+                sys.exit(1)
+        ifname = sortedname
+    if opts['shards'] > 1:
+        try:
+            processShards(uname, pwd, ifname, spoolname, manifest, opts)
+        except RequestException as e:
+            print "[ERROR] Can't size files : %s" % e
+            sys.exit(1)
+        except IOError as e:
+            print "[ERROR] Can't process '%s' in shards : %s" % (ifname, e)
+            sys.exit(1)
+    else:
+        # try opening the files    
+        try:
+            with openMetadata(ifname, "rb") as fhi, \
+                 (open(spoolname, "r+b") if state else openMetadata(spoolname, "wb")) as fho:
+                # writer = csv.writer(fho, delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
+                writer = metadataWriter(fho, header=not state)
+                if state:
+                    # carry on from the last complete folder
+                    fhi.seek(state['input'])
+                    fho.seek(state['output'])
+                    fho.truncate()
+                    print "[INFO] Resuming at input offset %d" % state['input']
+                print "[INFO] Opened files successfully."
+                metrics.setTotal(os.path.getsize(ifname))
+                cache = SizeCache(opts['cache'], opts['maxAge'], opts['revalidate'])
+                sizer = ArcSizer(uname, pwd, opts['workers'], cache=cache, learn=opts['learn'],
+                                 manifest=manifest)
+                checkpoint = Checkpoint(journal, fho, resume=bool(state))
+                try:
+                    groupFiles(sizer.sizeAll(fhi), writer, checkpoint, state, \
+                               allocate=not spooled)
+                finally:
+                    checkpoint.close()
+                    cache.close()
+        except RequestException as e:
+            # a subclass of IOError, but the list was read; sizing failed
+            print "[ERROR] Can't size files : %s" % e
+            sys.exit(1)
+        except IOError:
+            print "[ERROR] Can't open '%s' file !" % ifname
+            return
+        except ValueError as e:
+            print "[ERROR] Can't allocate units : %s" % e
+            sys.exit(1)
+    if sortedname:
+        os.remove(sortedname)
+    if not spooled and os.path.exists(journal):
+        os.remove(journal)
+    if spooled:
+        with openMetadata(spoolname, "rb") as fhs, openMetadata(ofname, "wb") as fho:
+            writer = metadataWriter(fho)
+            try:
+                if opts['pack']:
+                    allocateUnits(fhs, writer, UNITS, UNIT_SIZE)
+                else:
+                    runningTotal = fillUnits(metadataReader(fhs), writer, UNITS, UNIT_SIZE)
+                    print "[INFO] Total arcs size : %s" % size(runningTotal)
+            except ValueError as e:
+                print "[ERROR] Can't allocate units : %s" % e
+                sys.exit(1)
+        os.remove(spoolname)
+        if os.path.exists(journal):
+            os.remove(journal)
+
+def processShards(uname, pwd, ifname, spoolname, manifest, opts):
+    """
+    Split the list into shards of whole crawl folders and run groupFiles on
+    each in its own worker process, then join the rows they write, in
+    order, into the spool, without units. Each worker keeps the sizes it
+    finds in a cache of its own, also looking in the main cache; these are
+    added to the main cache once every shard is done.
+    """
+    base = spoolname[:-4] if isEncrypted(spoolname) else spoolname
+    pattern = base + '.shard%d'
+    count = splitList(ifname, pattern + '.list' + ('.enc' if isEncrypted(ifname) else ''),
+                      opts['shards'])
+    names = [(pattern % k + '.list' + ('.enc' if isEncrypted(ifname) else ''),
+              pattern % k + '.csv' + ('.enc' if isEncrypted(spoolname) else ''),
+              pattern % k + '.db') for k in range(count)]
+    print "[INFO] Split into %d shards" % count
+    # the main cache must exist to be attached by the workers
+    SizeCache(opts['cache']).close()
+    shared['manifest'] = manifest
+    pool = Pool(count or 1)
+    try:
+        results = [pool.apply_async(sizeShard, (uname, pwd) + shard + (opts,))
+                   for shard in names]
+        counters = [result.get(MAX_WAIT) for result in results]
+    finally:
+        pool.terminate()
+        pool.join()
+    with openMetadata(spoolname, "wb") as fho:
+        metadataWriter(fho)
+        for listname, shardname, cachename in names:
+            with openMetadata(shardname, "rb") as fhs:
+                shutil.copyfileobj(fhs, fho, COPY_BUFFER)
+    cache = SizeCache(opts['cache'])
+    try:
+        for listname, shardname, cachename in names:
+            cache.absorb(cachename)
+    finally:
+        cache.close()
+    for shard in names:
+        for fname in shard:
+            os.remove(fname)
+    for counts in counters:
+        for name, n in counts.items():
+            metrics.count(name, n)
+
+def splitList(ifname, pattern, shards):
+    """
+    Split the input list into at most shards files of about the same size,
+    named by pattern % k, breaking only where groupFiles would start a new
+    folder (at a new crawl, or a name it can't parse), so that each can be
+    processed on its own. Returns the number of files written.
+    """
+    total = os.path.getsize(ifname)
+    count = done = 0
+    dir = None
+    fho = None
     try:
-        with open(ifname, "rb") as fhi, open(ofname, "wb") as fho:
-            # writer = csv.writer(fho, delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
-            fields = ['identifier','filename','folder','date_created','checksum', \
-                      'series_number','creating_body','crawl_start', 'crawl_end', \
-                      'filesize', 'unit']
-            writer = DictWriter(fho, delimiter=',', fieldnames=fields)
-            writer.writerow(dict((fn,fn) for fn in fields))
-            print "[INFO] Opened files successfully."
-            groupFiles(uname, pwd, fhi, writer)
-    except IOError:
-        print "[ERROR] Can't open '%s' file !" % ifname
-
-def groupFiles(uname, pwd, fhi, writer):
-    """
-    Process an input list of Arc filenames, generating one CSV row for each 
-    filename. Each row contains most of the values that will be needed for the
-    metadata (though not the checksum), as well as the allocation of each file to a drive
+        with openMetadata(ifname, "rb") as fhi:
+            for line in fhi:
+                parts = parseFilename(line.split('/')[-1].rstrip())
+                newdir = parts[0] if parts else None
+                if fho is None or \
+                   ((newdir is None or newdir != dir) and done >= count * total / shards):
+                    if fho is not None:
+                        fho.close()
+                    fho = openMetadata(pattern % count, "wb")
+                    count += 1
+                dir = newdir
+                fho.write(line)
+                done += len(line)
+    finally:
+        if fho is not None:
+            fho.close()
+    return count
+
+def sizeShard(uname, pwd, listname, shardname, cachename, opts):
+    """
+    Size and group one shard of the list, in a worker process, writing its
+    rows without units. Returns the metric counters for this shard alone,
+    as a worker may be given more than one.
+    """
+    before = metrics.registry.summary()['counters']
+    cache = SizeCache(cachename, opts['maxAge'], opts['revalidate'], base=opts['cache'])
+    try:
+        with openMetadata(listname, "rb") as fhi, openMetadata(shardname, "wb") as fho:
+            metrics.setTotal(os.path.getsize(listname))
+            sizer = ArcSizer(uname, pwd, opts['workers'], cache=cache, learn=opts['learn'],
+                             manifest=shared.get('manifest'))
+            groupFiles(sizer.sizeAll(fhi), metadataWriter(fho, header=False), allocate=False)
+    finally:
+        cache.close()
+    after = metrics.registry.summary()['counters']
+    return dict((name, n - before.get(name, 0)) for name, n in after.items()
+                if n != before.get(name, 0))
+
+def sortList(ifname, ofname, memory=DEFAULT_MEMORY):
+    """
+    Write the input list out sorted by crawl, timestamp and part number, so
+    that each crawl comes together in date order. Lists bigger than memory
+    bytes are sorted in runs on disk.
+    """
+    with openMetadata(ifname, "rb") as fhi, openMetadata(ofname, "wb") as fho:
+        count = 0
+        for line in externalSort((line for line in fhi if line.strip()), listKey, memory):
+            fho.write(line)
+            count += 1
+    print "[INFO] Sorted %d files" % count
+
+def groupFiles(sizedLines, writer, checkpoint=None, state=None, allocate=True):
+    """
+    Process an input list of Arc filenames, given as (line, size) pairs in
+    list order, generating one CSV row for each filename. Each row contains
+    most of the values that will be needed for the metadata (though not the
+    checksum), as well as the allocation of each file to a drive.
+    A checkpoint is saved as each folder is completed; a saved state can be
+    passed back in to carry on from there. Without allocate, the unit column
+    is left empty for unitAllocator to fill in. Raises ValueError if the
+    drives run out.
     """
     # define constants
-    # list of available drives by label
-    units = range(246,256)
+    units = list(UNITS)
     # size of each drive
     #general_pattern = re.compile('^(.*)[\-P](\d{6,17})[^\d](\d{1,5})?[^\d].*$')
     #tna_extracted_pattern = re.compile('^(.*\-(\d{4}))\-part\-(\d{8}).*$')
     #bl_old_pattern = re.compile('BL-\d{6}(\_\d+)?\-?(\d{8,14})?\-?(\d{5})?\.arc\.gz$')
     #bl_old_pattern = re.compile('BL\-\d{6,8}\.arc\.gz$')
     #bl_new_pattern = re.compile('(BL\-\d{6}(?:\_\d+))\-?(\d{8,14})?\-?(\d{5})?\.arc\.gz$')
-    blankRow = {'identifier':'', 'filename':'', 'folder': '', 'date_created':'', \
-                'checksum':'', 'series_number':'', 'creating_body':'IMF', \
-                'crawl_start':'', 'crawl_end':'', 'filesize':'', 'unit':''}
     # initialise variables
-    # array of files for one folder
-    crawl = []
+    # rows for one folder
+    crawl = CrawlBuffer()
     # folder name
     dir = ''
     # full path to folder
@@ -64,143 +276,161 @@ def groupFiles(uname, pwd, fhi, writer):
     # total bytes to write to a single drive
     runningTotal = 0
     # current disk drive (drive label is a unit number)
-    unit = units.pop(0)
+    unit = units.pop(0) if allocate else ''
+    # bytes of the input list consumed
+    offset = 0
+    if state:
+        offset = state['input']
+        runningTotal = state['runningTotal']
+        unit = state['unit']
+        units = state['units']
+        nonfits = state['nonfits']
 
     # Accumulate details for all the files to go in one folder,
     # outputting the details only when the folder is complete.
-    for line in fhi:
-        # establish the size of the file
-        arcSize = getArcSize(uname, pwd, line)
-        runningTotal += long(arcSize)
-        print "[INFO] Total arcs size : %s" % size(runningTotal)
+    for line, arcSize in sizedLines:
+        # allocation state before this line, saved if it starts a new folder
+        saved = {'input': offset, 'runningTotal': runningTotal, 'unit': unit, \
+                 'units': units[:], 'nonfits': nonfits}
+        offset += len(line)
+        runningTotal += arcSize
+        metrics.count('rows')
+        metrics.observe('arc.size', arcSize)
+        metrics.progress(offset)
         # check whether we neeed to move to a new drive
-        if runningTotal >= UNIT_SIZE:
+        if allocate and runningTotal >= UNIT_SIZE:
+            print "[INFO] Unit %s full : %s" % (unit, size(runningTotal - arcSize))
+            metrics.count('units')
+            if not units:
+                raise ValueError("more than the %d units available are needed" % len(UNITS))
             unit = units.pop(0)
             runningTotal = arcSize
         # parse the filename 
         filename = line.split('/')[-1].rstrip()
-        if filename[:14] == 'TNA-EXTRACTED-':
-            pattern = re.compile('^(.*\-(\d{4}))\-part\-(\d{8}).*$')
-        else:
-            pattern = re.compile('^(.*)[\-P](\d{6,17})[^\d](\d{1,5})?[^\d].*$')
-        parts = re.match(pattern, filename)
+        parts = parseFilename(filename)
         if not parts:  # filename does not match regex - these should be RARE
             # print previous crawl, if any
-            printCrawl(writer, crawl, date)
-            crawl = []
+            printCrawl(writer, crawl, date, checkpoint, saved)
+            crawl.clear()
             dir = filename
             uriBase = IDENTIFIER_BASE + dir 
             # make directory of one file, with same name as directory
-            row = blankRow.copy()
-            row['identifier']= uriBase
-            row['filename'] = dir
-            row['folder'] = 'folder'
+            row = blankRow()
+            row[IDENTIFIER]= uriBase
+            row[FILENAME] = dir
+            row[FOLDER] = 'folder'
             writer.writerow(row)
-            row['identifier'] = uriBase + '/' + filename
-            row['filename'] = filename
-            row['folder'] = 'file'
-            row['checksum'] = '[checksum]'
-            row['filesize'] = arcSize
-            row['unit'] = unit
+            row[IDENTIFIER] = uriBase + '/' + filename
+            row[FILENAME] = filename
+            row[FOLDER] = 'file'
+            row[CHECKSUM] = '[checksum]'
+            row[FILESIZE] = arcSize
+            row[UNIT] = unit
             writer.writerow(row)
             nonfits = nonfits + 1 # just diagnostic
             continue
         # otherwise...
-        newdir = parts.group(1) # we can parse the filename
+        newdir, timestamp, part = parts # we can parse the filename
         if newdir != dir:
             # print previous crawl, if any
-            printCrawl(writer, crawl, date)
-            crawl = []
+            printCrawl(writer, crawl, date, checkpoint, saved)
+            crawl.clear()
             dir = newdir
             uriBase = IDENTIFIER_BASE + dir 
             # create the new folder row
-            row = blankRow.copy()
-            row['identifier']= uriBase
-            row['filename'] = dir
-            row['folder'] = 'folder'
-            crawlstart = dateConvert(parts.group(2))
-            row['crawl_start'] = crawlstart
+            row = blankRow()
+            row[IDENTIFIER]= uriBase
+            row[FILENAME] = dir
+            row[FOLDER] = 'folder'
+            crawlstart = dateConvert(timestamp)
+            row[CRAWL_START] = crawlstart
             crawl.append(row)
 
         # create the row for the current file
-        row = blankRow.copy()
-        row['filesize'] = arcSize
-        row['identifier'] = uriBase + '/' + filename
-        row['filename'] = filename
-        row['folder'] = 'file'
-        date = dateConvert(parts.group(2))
-        row['date_created'] = date
-        row['checksum'] = '[checksum]'
-        part = parts.group(3)
+        row = blankRow()
+        row[FILESIZE] = arcSize
+        row[IDENTIFIER] = uriBase + '/' + filename
+        row[FILENAME] = filename
+        row[FOLDER] = 'file'
+        date = dateConvert(timestamp)
+        row[DATE_CREATED] = date
+        row[CHECKSUM] = '[checksum]'
         if part:
-            row['series_number'] = part
-        row['crawl_start'] = crawlstart
-        row['unit'] = unit
+            row[SERIES_NUMBER] = part
+        row[CRAWL_START] = crawlstart
+        row[UNIT] = unit
         crawl.append(row)
         # print(row) 
 
     #need to flush final crawl
-    printCrawl(writer, crawl, date)
+    printCrawl(writer, crawl, date, checkpoint, {'input': offset, \
+               'runningTotal': runningTotal, 'unit': unit, 'units': units, \
+               'nonfits': nonfits})
+    print "[INFO] Total arcs size : %s" % size(runningTotal)
+    metrics.progress(offset, final=True)
     print "[INFO] nonfits: " + `nonfits`
+    crawl.clear()
 
-def getArcSize(uname, pwd, url):
-    """
-    find the size of an Arc file by making a HEAD call to the url and parsing
-    the result.
-    """
-    user_agent = {'User-agent': 'processLists'}
-    h = requests.head(url.strip(),headers=user_agent,auth=HTTPBasicAuth(uname, pwd))
-    print "[INFO] HTTP Status : %s" % h.status_code
-    if h.status_code == 302:
-        print "[INFO] HTTP Location : %s" % h.headers['Location']
-        h = requests.head(h.headers['Location'], headers=user_agent, \
-                          auth=HTTPBasicAuth(uname, pwd))
-    # random sleep between 0.1 and 0.7 second (do not stress the server)
-    time.sleep(random.randint(1,7) / 10.0) 
-    if 'content-length' in h.headers:
-        return h.headers['content-length']
-    else:
-        print "[ERROR] HTTP Status : %s" % h.status_code
-        print "[DEBUG] HTTP Header : %s" % h.headers
-        return 0
-
-def dateConvert(date):
-    """
-    Convert multiple date formats to ISO8601 Probably false assumption made
-    that times are UTC.
-    """
-    # print date
-    # just a year
-    if len(date) == 4:
-        date = date
-    elif len(date) == 8:
-        date_object = datetime.strptime(date, '%Y%m%d')
-        date = strftime('%Y-%m-%d', date_object.timetuple())
-    elif len(date) == 12:
-        date_object = datetime.strptime(date, '%y%m%d%H%M%S')
-        date = strftime('%Y-%m-%dT%H:%M:%SZ', date_object.timetuple())
-    elif (len(date) == 14) or (len(date) == 17) :
-        date_object = datetime.strptime(date[:14], '%Y%m%d%H%M%S')
-        date = strftime('%Y-%m-%dT%H:%M:%SZ', date_object.timetuple())
-    else:
-        date = '*' + date # should never happen
-    return date
-        
-def printCrawl(writer, crawl, end_date):
+class CrawlBuffer(object):
+    """
+    The rows of one crawl folder, held until its crawl_end is known. Past
+    SPILL_ROWS rows they are spilled to a temporary segment file, so memory
+    stays flat however many parts a crawl has; iterating reads them back
+    in order, as the same text they would have been written as.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit or SPILL_ROWS
+        self.rows = []
+        self.segment = None
+
+    def append(self, row):
+        if len(self.rows) >= self.limit:
+            if self.segment is None:
+                self.segment = tempfile.TemporaryFile()
+            csv.writer(self.segment).writerows(self.rows)
+            self.rows = []
+            metrics.count('crawl.spilled', self.limit)
+        self.rows.append(row)
+
+    def __iter__(self):
+        if self.segment is not None:
+            self.segment.seek(0)
+            for row in csv.reader(self.segment):
+                yield row
+        for row in self.rows:
+            yield row
+
+    def clear(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment = None
+        self.rows = []
+
+def printCrawl(writer, crawl, end_date, checkpoint=None, state=None):
     """
-    Print all rows within a crawl folder, including the folder itself.
+    Print all rows within a crawl folder, including the folder itself,
+    then record the allocation state reached in the checkpoint journal.
     """
     for row in crawl:
-        row['crawl_end'] = end_date
+        row[CRAWL_END] = end_date
         writer.writerow(row)
+    if checkpoint:
+        checkpoint.save(state)
 
 def getParms():
     """
     Get command line parameters.
     """
     ifile = ofile = uname = pwd = ""
+    opts = {'workers': DEFAULT_WORKERS, 'cache': DEFAULT_CACHE,
+            'maxAge': DEFAULT_MAX_AGE, 'revalidate': False, 'resume': False,
+            'pack': False, 'sort': False, 'memory': DEFAULT_MEMORY, 'metrics': '',
+            'learn': True, 'manifests': [], 'shards': 1}
     try:
-        myopts, args = getopt(sys.argv[1:],"u:p:i:o:")
+        myopts, args = getopt(sys.argv[1:],"u:p:i:o:w:c:r",
+                              ["max-age=", "revalidate", "resume", "pack", "sort", "memory=",
+                               "metrics=", "no-learn", "manifest=", "shards="])
     except GetoptError as e:
         print (str(e))
         usage()
@@ -214,14 +444,41 @@ def getParms():
             uname = a
         elif o == '-p':
             pwd = a
+        elif o == '-w':
+            opts['workers'] = int(a)
+        elif o == '-c':
+            opts['cache'] = a
+        elif o == '--max-age':
+            opts['maxAge'] = float(a)
+        elif o == '--revalidate':
+            opts['revalidate'] = True
+        elif o in ('-r', '--resume'):
+            opts['resume'] = True
+        elif o == '--pack':
+            opts['pack'] = True
+        elif o == '--sort':
+            opts['sort'] = True
+        elif o == '--memory':
+            opts['memory'] = int(a) * 1024 * 1024
+        elif o == '--metrics':
+            opts['metrics'] = a
+        elif o == '--no-learn':
+            opts['learn'] = False
+        elif o == '--manifest':
+            opts['manifests'].append(a)
+        elif o == '--shards':
+            opts['shards'] = int(a)
 
     if not (uname and pwd and ifile and ofile):
         usage()
 
-    return (uname, pwd, ifile, ofile)
+    return (uname, pwd, ifile, ofile, opts)
 
 def usage():
-    print("Usage: %s -u username -p password -i input -o output" % sys.argv[0])
+    print("Usage: %s -u username -p password -i input -o output [-w workers]" \
+          " [-c sizecache] [--max-age days] [--revalidate] [-r] [--pack]" \
+          " [--sort [--memory MB]] [--metrics file.json] [--no-learn]" \
+          " [--manifest sizes]... [--shards N]" % sys.argv[0])
     sys.exit(2)
 
 
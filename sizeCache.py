@@ -0,0 +1,79 @@
+"""
+Persistent on-disk cache of remote Arc file sizes, keyed by url, so that
+a rerun needs no HTTP for sizes already known.
+"""
+
+import sqlite3, time
+from collections import namedtuple
+
+DEFAULT_CACHE = 'arcsizes.db'
+DEFAULT_MAX_AGE = 30    # days before a cached size is revalidated
+COMMIT_EVERY = 1000     # puts between commits
+COMMIT_INTERVAL = 5     # ... or seconds, so a run that dies loses few sizes
+
+# what a HEAD call tells us about one url
+SizeEntry = namedtuple('SizeEntry', 'size location etag lastModified')
+
+class SizeCache(object):
+    """
+    SQLite table of url -> content-length, resolved Location and the
+    ETag/Last-Modified validators, with the time each was fetched.
+    Entries older than maxAge days (or all entries, if revalidate is set)
+    are reported as stale, and should be checked against the server.
+    With a base cache, urls not found are looked for there too, but only
+    this one is written to; a worker process can then use the main cache
+    while writing its own, to be absorbed into the main one later.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE, maxAge=DEFAULT_MAX_AGE, revalidate=False,
+                 base=None):
+        self.maxAge = maxAge * 86400
+        self.revalidate = revalidate
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS sizes ('
+                        'url TEXT PRIMARY KEY, size INTEGER, location TEXT, '
+                        'etag TEXT, last_modified TEXT, fetched REAL)')
+        self.tables = ['sizes']
+        if base:
+            self.db.execute('ATTACH DATABASE ? AS base', (base,))
+            self.tables.append('base.sizes')
+        self.uncommitted = 0
+        self.committed = time.time()
+
+    def get(self, url):
+        """
+        Return (entry, fresh) for a url, or (None, False) if never seen.
+        """
+        for table in self.tables:
+            row = self.db.execute('SELECT size, location, etag, last_modified, fetched '
+                                  'FROM %s WHERE url = ?' % table, (url,)).fetchone()
+            if row is not None:
+                break
+        else:
+            return None, False
+        fresh = not self.revalidate and time.time() - row[4] < self.maxAge
+        return SizeEntry(long(row[0]), row[1], row[2], row[3]), fresh
+
+    def put(self, url, entry):
+        self.db.execute('INSERT OR REPLACE INTO sizes VALUES (?, ?, ?, ?, ?, ?)',
+                        (url, entry.size, entry.location, entry.etag,
+                         entry.lastModified, time.time()))
+        self.uncommitted += 1
+        if self.uncommitted >= COMMIT_EVERY or time.time() - self.committed >= COMMIT_INTERVAL:
+            self.db.commit()
+            self.uncommitted = 0
+            self.committed = time.time()
+
+    def absorb(self, path):
+        """
+        Copy every entry of another cache file into this one.
+        """
+        self.db.commit()
+        self.db.execute('ATTACH DATABASE ? AS other', (path,))
+        self.db.execute('INSERT OR REPLACE INTO sizes SELECT * FROM other.sizes')
+        self.db.commit()
+        self.db.execute('DETACH DATABASE other')
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
@@ -0,0 +1,98 @@
+"""
+Sizes of Arc files taken in bulk from listings the archive already has,
+so that only the files none of them cover need a HEAD request. Three
+kinds of manifest are read, told apart by their first line:
+  CDX index    - ' CDX ...' header line; a file's size is the end of its
+                 last record (offset plus compressed length)
+  ls -l        - a long directory listing, as from ls -l or ls -lR
+  S3 inventory - CSV of bucket, key, size, ...
+"""
+
+import csv, re, urllib
+from itertools import chain
+from opensslStream import openMetadata
+
+# a regular file in a long listing: size and name
+LS_LINE = re.compile(r'^-\S{9}\S?\s+\d+\s+\S+\s+\S+\s+(\d+)\s+\S+\s+\S+\s+\S+\s+(.+)$')
+
+class SizeManifest(object):
+    """
+    Hash index of filename -> size, loaded from any number of manifests.
+    Files are matched on the last part of their url or path; a filename
+    given two different sizes is ambiguous, and is left to be looked up.
+    """
+
+    def __init__(self, fnames=()):
+        self.sizes = {}
+        for fname in fnames:
+            self.load(fname)
+
+    def load(self, fname):
+        with openMetadata(fname, "rb") as fh:
+            first = fh.readline()
+            if first.lstrip().startswith('CDX'):
+                entries = cdxSizes(first.split()[1:], fh)
+            elif LS_LINE.match(first) or first.startswith('total ') or first.rstrip().endswith(':'):
+                entries = lsSizes(first, fh)
+            else:
+                entries = inventorySizes(first, fh)
+            count = 0
+            for name, size in entries:
+                self.add(name, size)
+                count += 1
+        print "[INFO] Loaded %d sizes from %s" % (count, fname)
+
+    def add(self, name, size):
+        name = name.rstrip('/').split('/')[-1]
+        if self.sizes.get(name, size) != size:
+            size = None
+        self.sizes[name] = size
+
+    def get(self, url):
+        """
+        The size of the file a url or path names, or None if not known.
+        """
+        return self.sizes.get(url.strip().split('/')[-1])
+
+    def __len__(self):
+        return len(self.sizes)
+
+def cdxSizes(fields, lines):
+    """
+    (filename, size) for each file in a CDX index with the given field
+    letters, which must include V (offset), S (compressed length) and g
+    (file name). Records are in url order, so each file's end is found
+    over the whole index before any is given.
+    """
+    try:
+        offset, length, name = fields.index('V'), fields.index('S'), fields.index('g')
+    except ValueError:
+        raise IOError("CDX index has no V, S and g fields to size files from")
+    ends = {}
+    for line in lines:
+        values = line.split()
+        if len(values) != len(fields) or not (values[offset].isdigit() and values[length].isdigit()):
+            continue
+        end = long(values[offset]) + long(values[length])
+        if end > ends.get(values[name], 0):
+            ends[values[name]] = end
+    return ends.iteritems()
+
+def lsSizes(first, lines):
+    """
+    (filename, size) for each regular file in a long listing; totals,
+    directory headers and anything but plain files are passed over.
+    """
+    for line in chain([first], lines):
+        match = LS_LINE.match(line.rstrip('\n'))
+        if match:
+            yield match.group(2), long(match.group(1))
+
+def inventorySizes(first, lines):
+    """
+    (key, size) for each object in an S3 inventory CSV, whose keys are
+    URL encoded.
+    """
+    for row in csv.reader(chain([first], lines)):
+        if len(row) >= 3 and row[2].isdigit():
+            yield urllib.unquote(row[1]), long(row[2])
@@ -0,0 +1,260 @@
+#!/usr/bin/python
+"""
+Copy each Arc file to the unit and folder the metadata assigns it,
+hashing it on the way so every byte is read only once, and write the
+metadata out again with the checksum column filled in. Each unit has a
+writer thread with its own queue of files, in metadata order, so all the
+drives are written at once but none is ever written two files at a time.
+Every file copied is recorded in a journal (output.copied), from which an
+interrupted transfer is carried on (-r).
+"""
+
+from getopt import getopt, GetoptError
+import sys, os, hashlib, threading, Queue
+from arcHasher import DIGESTS, BLOCK_SIZE, MAX_WAIT
+from checksumCache import ChecksumCache, DEFAULT_CACHE as DEFAULT_CHECKSUMS
+from verifyUnits import DEFAULT_MOUNT, IDENTIFIER_ROOT
+from opensslStream import openMetadata
+from metadataRow import metadataReader, metadataWriter, IDENTIFIER, FOLDER, \
+     CHECKSUM, FILESIZE, UNIT
+import metrics
+
+def main(argv):
+    filelist, ifname, ofname, opts = getParms()
+    if opts['metrics']:
+        metrics.dumpAtExit(opts['metrics'])
+    journal = ofname + '.copied'
+    try:
+        with openMetadata(filelist, "rb") as fhl:
+            sources = readSources(fhl)
+        done = loadJournal(journal) if opts['resume'] else {}
+        with openMetadata(ifname, "rb") as fhi:
+            units = unitJobs(metadataReader(fhi), sources, opts['mount'], opts['units'], done)
+        checksums = ChecksumCache(opts['checksums'])
+        try:
+            with openMetadata(ifname, "rb") as fhi, openMetadata(ofname, "wb") as fho, \
+                 open(journal, "ab" if opts['resume'] else "wb") as fhj:
+                reader = metadataReader(fhi)
+                print "[INFO] Opened files successfully."
+                counts = transferUnits(units, reader, metadataWriter(fho, reader.fields), fhj,
+                                       done, checksums, opts['mount'], opts['digest'])
+        finally:
+            checksums.close()
+    except IOError as e:
+        print "[IOERROR] %s" % e
+        sys.exit(1)
+    for status in sorted(counts):
+        print "[INFO] %s : %d" % (status, counts[status])
+    if set(counts) - set(['ok']):
+        sys.exit(1)
+
+def readSources(fhl):
+    """
+    Where to copy each file from: a dict of filename -> path, from a list
+    of paths.
+    """
+    sources = {}
+    for line in fhl:
+        path = line.strip()
+        if path:
+            sources[path.split('/')[-1]] = path
+    return sources
+
+def destination(row, mount=DEFAULT_MOUNT):
+    """
+    Where a file row is to be written: its identifier, under its unit's
+    mountpoint.
+    """
+    return (mount % row[UNIT]) + row[IDENTIFIER].replace(IDENTIFIER_ROOT, '')
+
+def unitJobs(rows, sources, mount=DEFAULT_MOUNT, only=None, done=None):
+    """
+    The files to copy to each unit, in metadata order, as a dict of unit ->
+    list of (source, destination, size). Files already in the journal's
+    done dict are left out; a file with no source is given None.
+    """
+    done = done or {}
+    units = {}
+    for row in rows:
+        if row[FOLDER] != 'file' or row[UNIT] == '' or (only and row[UNIT] not in only):
+            continue
+        dest = destination(row, mount)
+        if dest not in done:
+            source = sources.get(row[IDENTIFIER].split('/')[-1])
+            units.setdefault(row[UNIT], []).append((source, dest, row[FILESIZE]))
+    return units
+
+def loadJournal(fname):
+    """
+    The digests of the files an earlier run copied, as a dict of
+    destination -> digests. A line left half written is cut off.
+    """
+    done = {}
+    if not os.path.exists(fname):
+        return done
+    complete = 0
+    with open(fname, "r+b") as fh:
+        for line in fh:
+            if not line.endswith('\n'):
+                break
+            complete += len(line)
+            unit, status, dest, detail = line.rstrip('\n').split('\t')
+            if status == 'ok':
+                done[dest] = dict(zip(DIGESTS, detail.split()))
+        fh.truncate(complete)
+    return done
+
+def copyFile(source, dest, digests=DIGESTS):
+    """
+    Copy a file through large buffers, feeding each block to every digest
+    as it goes by. The copy is written next to dest and only renamed into
+    place once it is complete and synced to disk. Returns a dict of digest
+    name -> hex digest.
+    """
+    hashes = [hashlib.new(name) for name in digests]
+    folder = os.path.dirname(dest)
+    if not os.path.isdir(folder):
+        try:
+            os.makedirs(folder)
+        except OSError:
+            # made by another unit's writer in the meantime
+            if not os.path.isdir(folder):
+                raise
+    partial = dest + '.part'
+    with open(source, "rb") as fi, open(partial, "wb") as fo:
+        for chunk in iter(lambda: fi.read(BLOCK_SIZE), b""):
+            fo.write(chunk)
+            for h in hashes:
+                h.update(chunk)
+            metrics.count('hash.bytes', len(chunk))
+        fo.flush()
+        os.fsync(fo.fileno())
+    os.rename(partial, dest)
+    return dict((name, h.hexdigest()) for name, h in zip(digests, hashes))
+
+def copyChecked(source, dest, filesize):
+    """
+    (status, detail, digests) of copying one file: 'ok' with its digests,
+    or 'missing', 'size' or 'error' with what went wrong.
+    """
+    if source is None:
+        return 'missing', 'not in the file list', None
+    try:
+        found = os.path.getsize(source)
+        if filesize and long(filesize) != found:
+            return 'size', 'expected %s, found %d' % (filesize, found), None
+        return 'ok', '', copyFile(source, dest)
+    except (IOError, OSError) as e:
+        return 'error', str(e), None
+
+def unitWriter(unit, jobs, results):
+    """
+    Copy one unit's files in turn, putting each outcome on the results queue.
+    """
+    for source, dest, filesize in jobs:
+        results.put((unit, source, dest) + copyChecked(source, dest, filesize))
+
+def transferUnits(units, rows, writer, journal, done, checksums, mount=DEFAULT_MOUNT,
+                  digest='md5'):
+    """
+    Start a writer thread per unit, then write every metadata row out as
+    its file is copied, with the checksum (the chosen digest) filled in.
+    A file that could not be copied keeps the checksum it had. Each copy is
+    journalled as it finishes, as a line of unit, status, destination and
+    detail (the digests, for a file copied). Returns a count of files by
+    status.
+    """
+    results = Queue.Queue()
+    for unit in sorted(units):
+        thread = threading.Thread(target=unitWriter, args=(unit, units[unit], results))
+        thread.daemon = True
+        thread.start()
+    expected = set(dest for jobs in units.values() for source, dest, filesize in jobs)
+    metrics.setTotal(len(expected))
+    finished = {}
+    counts = {}
+
+    def collect():
+        unit, source, dest, status, detail, digests = results.get(timeout=MAX_WAIT)
+        if digests:
+            detail = ' '.join(digests[name] for name in DIGESTS)
+            checksums.put(source, digests)
+            metrics.count('copy.files')
+        journal.write('%s\t%s\t%s\t%s\n' % (unit, status, dest, detail))
+        journal.flush()
+        counts[status] = counts.get(status, 0) + 1
+        if status != 'ok':
+            print "[%s] %s %s" % (status.upper(), dest, detail)
+        finished[dest] = digests
+        metrics.progress(len(finished))
+
+    for row in rows:
+        if row[FOLDER] == 'file' and row[UNIT] != '':
+            dest = destination(row, mount)
+            if dest in expected:
+                while dest not in finished:
+                    collect()
+                digests = finished[dest]
+            else:
+                digests = done.get(dest)
+            if digests:
+                row[CHECKSUM] = digests[digest]
+        writer.writerow(row)
+        metrics.count('rows')
+    while len(finished) < len(expected):
+        collect()
+    metrics.progress(len(finished), final=True)
+    return counts
+
+def getParms():
+    """
+    Get command line parameters.
+    """
+    filelist = ifile = ofile = ""
+    opts = {'mount': DEFAULT_MOUNT, 'units': None, 'digest': 'md5',
+            'checksums': DEFAULT_CHECKSUMS, 'resume': False, 'metrics': ''}
+    try:
+        myopts, args = getopt(sys.argv[1:],"f:i:o:m:u:d:c:r", ["metrics="])
+    except GetoptError as e:
+        print (str(e))
+        usage()
+
+    for o, a in myopts:
+        if o == '-f':
+            filelist = a
+        elif o == '-i':
+            ifile = a
+        elif o == '-o':
+            ofile = a
+        elif o == '-m':
+            opts['mount'] = a
+        elif o == '-u':
+            opts['units'] = a.split(',')
+        elif o == '-d':
+            opts['digest'] = a
+        elif o == '-c':
+            opts['checksums'] = a
+        elif o == '-r':
+            opts['resume'] = True
+        elif o == '--metrics':
+            opts['metrics'] = a
+
+    if not (filelist and ifile and ofile) or '%s' not in opts['mount'] \
+       or opts['digest'] not in DIGESTS:
+        usage()
+    if not opts['mount'].endswith('/'):
+        opts['mount'] += '/'
+
+    return (filelist, ifile, ofile, opts)
+
+def usage():
+    print("Usage: %s -f filelist -i metadata -o outputmetadata [-m mountpattern]" \
+          " [-u unit,unit...] [-d md5|sha256] [-c checksumcache] [-r]" \
+          " [--metrics file.json]" % sys.argv[0])
+    print("The mount pattern gives each unit's mountpoint, with %%s for its label" \
+          " (default %s)" % DEFAULT_MOUNT)
+    sys.exit(2)
+
+
+if __name__ == "__main__":
+   main(sys.argv[1:])
@@ -0,0 +1,128 @@
+"""
+Allocate whole crawl folders to drives by bin-packing, rather than filling
+drives one after another in list order. Works from a metadata file written
+without units, in two passes: one to total each folder, one to write the
+rows out again with their unit. fillUnits instead fills the drives in
+order in a single pass, as processLists does as it goes. Files flagged as
+duplicates take no space and are given no unit.
+"""
+
+from hurry.filesize import size
+from metadataRow import metadataReader, isDuplicate, FOLDER, FILESIZE, UNIT
+
+def folderSizes(reader, capacity):
+    """
+    Total bytes for each folder, in order. For any folder too big to fit on
+    one drive, the individual file sizes are kept too, so it can be split.
+    """
+    sizes = []
+    oversized = {}
+    files = []
+    for row in reader:
+        if row[FOLDER] == 'folder':
+            if sizes and sizes[-1] >= capacity:
+                oversized[len(sizes) - 1] = files
+            sizes.append(0)
+            files = []
+        elif not isDuplicate(row):
+            sizes[-1] += long(row[FILESIZE])
+            files.append(long(row[FILESIZE]))
+    if sizes and sizes[-1] >= capacity:
+        oversized[len(sizes) - 1] = files
+    return sizes, oversized
+
+def packFolders(sizes, oversized, capacity):
+    """
+    Assign each folder to a bin. Oversized folders are split file by file
+    over bins of their own; every other folder is placed whole by
+    best-fit decreasing, which can also use the tail space left by a split.
+    Returns (assignment, used): a bin per folder (a list of bins, one per
+    file, for a split folder), and the bytes in each bin.
+    """
+    assignment = {}
+    used = []
+    for index in sorted(oversized):
+        bins = []
+        used.append(0)
+        for filesize in oversized[index]:
+            if used[-1] + filesize >= capacity and used[-1]:
+                used.append(0)
+            used[-1] += filesize
+            bins.append(len(used) - 1)
+        assignment[index] = bins
+    order = sorted((i for i in range(len(sizes)) if i not in oversized),
+                   key=lambda i: sizes[i], reverse=True)
+    for index in order:
+        best = None
+        for b in range(len(used)):
+            if used[b] + sizes[index] < capacity and \
+               (best is None or used[b] > used[best]):
+                best = b
+        if best is None:
+            used.append(0)
+            best = len(used) - 1
+        used[best] += sizes[index]
+        assignment[index] = best
+    return assignment, used
+
+def allocateUnits(fhs, writer, units, capacity):
+    """
+    Bin-pack the folders in an unallocated metadata file onto the given
+    units, then write it out again with the unit column filled in.
+    Units are numbered in order of first use, so they still ascend through
+    the output. Raises ValueError if more units are needed than are given.
+    """
+    sizes, oversized = folderSizes(metadataReader(fhs), capacity)
+    assignment, used = packFolders(sizes, oversized, capacity)
+    if len(used) > len(units):
+        raise ValueError("%d units needed, only %d available" % (len(used), len(units)))
+    labels = {}
+    fhs.seek(0)
+    index = -1
+    for row in metadataReader(fhs):
+        if row[FOLDER] == 'folder':
+            index += 1
+            part = 0
+        elif not isDuplicate(row):
+            b = assignment[index]
+            if isinstance(b, list):
+                b = b[part]
+                part += 1
+            if b not in labels:
+                labels[b] = units[len(labels)]
+            row[UNIT] = labels[b]
+        writer.writerow(row)
+    report(labels, used, capacity)
+
+def report(labels, used, capacity):
+    """
+    Print how full each unit is.
+    """
+    for b in sorted(labels, key=labels.get):
+        print "[INFO] Unit %s : %s (%.1f%%)" % (labels[b], size(used[b]), \
+                                                100.0 * used[b] / capacity)
+
+def fillUnits(reader, writer, units, capacity):
+    """
+    Fill the units one after another in row order, moving on to the next
+    as soon as a file would take a unit to capacity, exactly as groupFiles
+    allocates them, for rows written without units. Returns the bytes on
+    the last unit. Raises ValueError if more units are needed than are given.
+    """
+    available = len(units)
+    units = list(units)
+    unit = units.pop(0)
+    runningTotal = 0
+    for row in reader:
+        if row[FOLDER] == 'file' and not isDuplicate(row):
+            filesize = long(row[FILESIZE])
+            runningTotal += filesize
+            if runningTotal >= capacity:
+                print "[INFO] Unit %s full : %s" % (unit, size(runningTotal - filesize))
+                if not units:
+                    raise ValueError("more than the %d units available are needed" % available)
+                unit = units.pop(0)
+                runningTotal = filesize
+            row[UNIT] = unit
+        writer.writerow(row)
+    return runningTotal
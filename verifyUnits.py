@@ -0,0 +1,204 @@
+#!/usr/bin/python
+"""
+Check the files written to each unit against the metadata: every file
+must be there, with the size and checksum the metadata gives it.
+Files are grouped by unit and each unit is read by one file at a time, in
+metadata order, so no disk is asked for two files at once; the hashing
+itself is spread over a pool of processes, so all the drives are read in
+parallel. Results go to a report file, which is also the journal a run
+is resumed from (-r).
+"""
+
+from getopt import getopt, GetoptError
+import sys, os, Queue
+from multiprocessing import Pool, cpu_count
+from arcHasher import hashFile, MAX_WAIT
+from opensslStream import openMetadata
+from metadataRow import metadataReader, IDENTIFIER, FOLDER, CHECKSUM, FILESIZE, UNIT
+import metrics
+
+DEFAULT_MOUNT = '/media/%s/'    # where each unit is mounted, by label
+IDENTIFIER_ROOT = 'file:///T:WORK/'
+# hex digest length -> digest
+DIGEST_LENGTHS = {32: 'md5', 64: 'sha256'}
+
+def main(argv):
+    ifname, ofname, opts = getParms()
+    try:
+        with openMetadata(ifname, "rb") as fhi:
+            units = unitFiles(metadataReader(fhi), opts['mount'], opts['units'])
+        done = loadReport(ofname) if opts['resume'] else {}
+        with open(ofname, "ab" if opts['resume'] else "wb") as report:
+            counts = verifyUnits(units, report, done, opts['processes'])
+    except IOError as e:
+        print "[IOERROR] %s" % e
+        sys.exit(1)
+    for status in sorted(counts):
+        print "[INFO] %s : %d" % (status, counts[status])
+    if set(counts) - set(['ok']):
+        sys.exit(1)
+
+def unitFiles(rows, mount=DEFAULT_MOUNT, only=None):
+    """
+    Group the file rows by unit, keeping metadata order within each unit,
+    as a dict of unit -> list of (path, size, checksum).
+    """
+    units = {}
+    for row in rows:
+        if row[FOLDER] != 'file' or row[UNIT] == '' or (only and row[UNIT] not in only):
+            continue
+        path = (mount % row[UNIT]) + row[IDENTIFIER].replace(IDENTIFIER_ROOT, '')
+        units.setdefault(row[UNIT], []).append((path, row[FILESIZE], row[CHECKSUM]))
+    return units
+
+def loadReport(fname):
+    """
+    Number of files already checked on each unit, from a report left by an
+    earlier run. Units are checked in order, so these are always the first
+    files of the unit. A line left half written is cut off.
+    """
+    done = {}
+    if not os.path.exists(fname):
+        return done
+    complete = 0
+    with open(fname, "r+b") as fh:
+        for line in fh:
+            if not line.endswith('\n'):
+                break
+            complete += len(line)
+            unit = line.split('\t', 1)[0]
+            done[unit] = done.get(unit, 0) + 1
+        fh.truncate(complete)
+    return done
+
+def checkFile(path, size, checksum):
+    """
+    What can be said about a file without reading it: 'missing', 'size'
+    (with the size found) or 'unchecked' if the metadata has no checksum;
+    otherwise the digest to check it with.
+    """
+    try:
+        found = os.path.getsize(path)
+    except OSError:
+        return 'missing', ''
+    if size and long(size) != found:
+        return 'size', 'expected %s, found %d' % (size, found)
+    digest = DIGEST_LENGTHS.get(len(checksum))
+    if digest is None:
+        return 'unchecked', checksum
+    return None, digest
+
+def hashChecked(path, digest):
+    """
+    (hex digest, None) of a file, or (None, error) if it cannot be read.
+    """
+    try:
+        return hashFile(path, (digest,))[digest], None
+    except (IOError, OSError) as e:
+        return None, str(e)
+
+def verifyUnits(units, report, done=None, processes=None):
+    """
+    Check every unit's files, one at a time per unit, hashing in a process
+    pool. Each file's result is appended to the report as a line of unit,
+    status, path and detail. Returns a count of files by status.
+    """
+    done = done or {}
+    pool = Pool(processes or cpu_count())
+    finished = Queue.Queue()
+    counts = {}
+    position = dict((unit, done.get(unit, 0)) for unit in units)
+    metrics.setTotal(sum(len(files) for files in units.values()))
+    checked = [sum(position.values())]
+
+    def record(unit, status, path, detail=''):
+        report.write('%s\t%s\t%s\t%s\n' % (unit, status, path, detail))
+        report.flush()
+        counts[status] = counts.get(status, 0) + 1
+        metrics.count('verify.' + status)
+        metrics.count('rows')
+        checked[0] += 1
+        metrics.progress(checked[0])
+        if status != 'ok':
+            print "[%s] %s %s" % (status.upper(), path, detail)
+
+    def submit(unit):
+        """
+        Start on the unit's next file that needs reading; False if none is left.
+        """
+        files = units[unit]
+        while position[unit] < len(files):
+            path, size, checksum = files[position[unit]]
+            position[unit] += 1
+            status, detail = checkFile(path, size, checksum)
+            if status:
+                record(unit, status, path, detail)
+                continue
+            pool.apply_async(hashChecked, (path, detail),
+                             callback=lambda result, unit=unit, path=path, \
+                                 checksum=checksum: \
+                                 finished.put((unit, path, checksum) + result))
+            return True
+        return False
+
+    try:
+        busy = set(unit for unit in units if submit(unit))
+        while busy:
+            unit, path, checksum, found, error = finished.get(timeout=MAX_WAIT)
+            if error:
+                record(unit, 'error', path, error)
+            elif found == checksum.lower():
+                record(unit, 'ok', path)
+            else:
+                record(unit, 'mismatch', path, 'expected %s, found %s' % (checksum, found))
+            if not submit(unit):
+                busy.discard(unit)
+    finally:
+        pool.terminate()
+        pool.join()
+    metrics.progress(checked[0], final=True)
+    return counts
+
+def getParms():
+    """
+    Get command line parameters.
+    """
+    ifile = ofile = ""
+    opts = {'mount': DEFAULT_MOUNT, 'units': None, 'processes': None, 'resume': False}
+    try:
+        myopts, args = getopt(sys.argv[1:],"i:o:m:u:j:r")
+    except GetoptError as e:
+        print (str(e))
+        usage()
+
+    for o, a in myopts:
+        if o == '-i':
+            ifile = a
+        elif o == '-o':
+            ofile = a
+        elif o == '-m':
+            opts['mount'] = a
+        elif o == '-u':
+            opts['units'] = a.split(',')
+        elif o == '-j':
+            opts['processes'] = int(a)
+        elif o == '-r':
+            opts['resume'] = True
+
+    if not (ifile and ofile) or '%s' not in opts['mount']:
+        usage()
+    if not opts['mount'].endswith('/'):
+        opts['mount'] += '/'
+
+    return (ifile, ofile, opts)
+
+def usage():
+    print("Usage: %s -i metadata -o report [-m mountpattern] [-u unit,unit...]" \
+          " [-j processes] [-r]" % sys.argv[0])
+    print("The mount pattern gives each unit's mountpoint, with %%s for its label" \
+          " (default %s)" % DEFAULT_MOUNT)
+    sys.exit(2)
+
+
+if __name__ == "__main__":
+   main(sys.argv[1:])